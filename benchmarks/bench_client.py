@@ -0,0 +1,136 @@
+# Overhead of the client itself, measured against pypresence.testing.FakeDiscordServer instead of a real Discord.
+# Run from the repository root: python benchmarks/bench_client.py [--scale 0.1]
+
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pypresence import AsyncClient, AsyncPresence, Client, Presence
+from pypresence.payloads import json_backend
+from pypresence.testing import FakeDiscordServer
+
+CLIENT_ID = '123456789012345678'
+
+
+def report(name, value, unit):
+    print('{:<40} {:>12.1f} {}'.format(name, value, unit))
+
+
+def bench_handshake(count):
+    async def run():
+        times = []
+        for _ in range(count):
+            rpc = AsyncPresence(CLIENT_ID)
+            start = time.perf_counter()
+            await rpc.connect()
+            times.append(time.perf_counter() - start)
+            await rpc.close()
+        return times
+
+    times = asyncio.run(run())
+    report('handshake, median', statistics.median(times) * 1e6, 'us')
+
+
+def bench_sync_commands(count):
+    rpc = Presence(CLIENT_ID, loop=asyncio.new_event_loop())
+    rpc.connect()
+    start = time.perf_counter()
+    for i in range(count):
+        rpc.update(state='Level {}'.format(i), details='Benchmarking', large_image='logo')
+    report('set_activity, sync, sequential', count / (time.perf_counter() - start), 'cmd/s')
+    rpc.close()
+
+    client = Client(CLIENT_ID, loop=asyncio.new_event_loop())
+    client.start()
+    start = time.perf_counter()
+    for i in range(count):
+        client.get_guild(i)
+    report('get_guild, sync, sequential', count / (time.perf_counter() - start), 'cmd/s')
+    client.close()
+
+
+def bench_pipelined(count, in_flight=100):
+    async def run():
+        client = AsyncClient(CLIENT_ID)
+        await client.start()
+        start = time.perf_counter()
+        for offset in range(0, count, in_flight):
+            await asyncio.gather(*[client.get_guild(i) for i in range(offset, min(offset + in_flight, count))])
+        elapsed = time.perf_counter() - start
+        await client.close()
+        return elapsed
+
+    report('get_guild, async, {} in flight'.format(in_flight), count / asyncio.run(run()), 'cmd/s')
+
+
+def bench_events(server, count):
+    async def run():
+        client = AsyncClient(CLIENT_ID)
+        await client.start()
+        received = 0
+        done = asyncio.get_running_loop().create_future()
+
+        def on_message(data):
+            nonlocal received
+            received += 1
+            if received == count and not done.done():
+                done.set_result(None)
+
+        await client.register_event('MESSAGE_CREATE', on_message)
+        listener = asyncio.ensure_future(client.respond_to_events())
+        start = time.perf_counter()
+        server.burst(count, 'MESSAGE_CREATE', {'channel_id': '1', 'message': {'content': 'x' * 64}})
+        await done
+        elapsed = time.perf_counter() - start
+        await client.close()
+        await listener
+        return elapsed
+
+    report('event dispatch, respond_to_events', count / asyncio.run(run()), 'evt/s')
+
+
+def bench_soak(count):
+    rpc = Presence(CLIENT_ID, loop=asyncio.new_event_loop())
+    rpc.connect()
+    for i in range(count // 10):
+        rpc.update(state='warmup {}'.format(i))
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        rpc.update(state='soak {}'.format(i), details='Long running', start=i)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rpc.close()
+    report('memory growth over {} updates'.format(count), (after - before) / 1024, 'KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the iteration counts')
+    options = parser.parse_args()
+    scale = lambda n: max(1, int(n * options.scale))
+
+    server = FakeDiscordServer().start_in_thread()
+    os.environ['XDG_RUNTIME_DIR'] = server.ipc_dir
+    print('json backend:', json_backend)
+    try:
+        bench_handshake(scale(200))
+        bench_sync_commands(scale(5000))
+        bench_pipelined(scale(20000))
+        bench_events(server, scale(50000))
+        bench_soak(scale(20000))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Encode cost of one SET_ACTIVITY frame, the old dict + remove_none + json.dumps path against the command table,
+# and the Activity paths used by Presence.patch().
+# Run from the repository root: python benchmarks/bench_encode.py
+
+import json
+import os
+import struct
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pypresence.payloads import SET_ACTIVITY, Activity, encode_frame, json_backend
+from pypresence.utils import remove_none
+
+N = 100000
+ACTIVITY = dict(state="In a match", details="Ranked 2v2", start=1530000000, large_image="map_1",
+                large_text="Map 1", party_id="ae488379-351d-4a4f-ad32-2b9b01c91657", party_size=[1, 2])
+
+
+def before():
+    # what Presence.update used to do for every call
+    payload = {
+        "cmd": "SET_ACTIVITY",
+        "args": {
+            "pid": 1234,
+            "activity": {
+                "state": ACTIVITY["state"],
+                "details": ACTIVITY["details"],
+                "timestamps": {"start": ACTIVITY["start"], "end": None},
+                "assets": {"large_image": ACTIVITY["large_image"], "large_text": ACTIVITY["large_text"],
+                           "small_image": None, "small_text": None},
+                "party": {"id": ACTIVITY["party_id"], "size": ACTIVITY["party_size"]},
+                "secrets": {"join": None, "spectate": None, "match": None},
+                "instance": True,
+            },
+        },
+        "nonce": '{:.20f}'.format(time.time())
+    }
+    payload = json.dumps(remove_none(payload)).encode('utf-8')
+    return struct.pack('<II', 1, len(payload)) + payload
+
+
+def after():
+    args = SET_ACTIVITY.build_args(SET_ACTIVITY.bind('update', (1234,), ACTIVITY))
+    return encode_frame("SET_ACTIVITY", args, "1")
+
+
+_activity = Activity(1234, **ACTIVITY)
+_tick = 0
+
+
+def patched():
+    # Presence.patch(state=...): a new Activity with one field changed, encoded once
+    global _tick
+    _tick += 1
+    return encode_frame("SET_ACTIVITY", _activity.replace(state="Round {}".format(_tick)), "1")
+
+
+def resent():
+    # the same Activity again, e.g. replayed after a reconnect: its encoding is reused
+    return encode_frame("SET_ACTIVITY", _activity, "1")
+
+
+def main():
+    print("json backend:", json_backend)
+    for name, func in (("before", before), ("after", after), ("patched", patched), ("resent", resent)):
+        best = min(timeit.repeat(func, number=N, repeat=5))
+        print("{:<7} {:6.2f} us/frame  ({} bytes)".format(name, best / N * 1e6, len(func())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Cost of receiving a high-rate event stream where most events have no handler: 9 in 10 frames are large
+# MESSAGE_UPDATE events nobody handles, 1 in 10 a small handled MESSAGE_CREATE. The frames are fed straight
+# into the client's protocol, so only parsing and dispatch are measured, not the socket.
+# Run from the repository root: python benchmarks/bench_events.py
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pypresence import AsyncClient
+from pypresence.payloads import dumps, header, json_backend
+from pypresence.protocol import IPCProtocol
+
+FRAMES = 100000
+CHUNK = 65536
+
+
+def frame(evt, data):
+    payload = dumps({'cmd': 'DISPATCH', 'data': data, 'evt': evt, 'nonce': None})
+    return header.pack(1, len(payload)) + payload
+
+
+def stream():
+    message = {'id': '1', 'channel_id': '2', 'author': {'id': '3', 'username': 'someone', 'discriminator': '0001'},
+               'content': 'hello ' * 40, 'nonce': '1234', 'embeds': [], 'mentions': [], 'attachments': [],
+               'timestamp': '2018-01-01T00:00:00.000Z', 'edited_timestamp': None, 'tts': False, 'pinned': False}
+    update = frame('MESSAGE_UPDATE', {'channel_id': '2', 'message': dict(message, embeds=[
+        {'title': 'embed {}'.format(i), 'description': 'x' * 200, 'fields': [{'name': 'n', 'value': 'v'}] * 5}
+        for i in range(4)])})
+    create = frame('MESSAGE_CREATE', {'channel_id': '2', 'message': message})
+    blob = b''.join(create if i % 10 == 0 else update for i in range(FRAMES))
+    return blob, len(update), len(create)
+
+
+def run(blob, touch, **options):
+    async def feed():
+        client = AsyncClient('0', pipe=None, **options)
+        client.loop = asyncio.get_running_loop()
+        client.connected = True
+        handled = 0
+
+        def on_message(data):
+            nonlocal handled
+            handled += 1
+            if touch:
+                data['message']
+
+        client._events['MESSAGE_CREATE'] = on_message
+        protocol = IPCProtocol(client)
+        start = time.perf_counter()
+        for offset in range(0, len(blob), CHUNK):
+            protocol.data_received(blob[offset:offset + CHUNK])
+        elapsed = time.perf_counter() - start
+        assert handled == FRAMES // 10, handled
+        return elapsed
+
+    return asyncio.run(feed())
+
+
+def main():
+    blob, update_size, create_size = stream()
+    print('json backend:', json_backend)
+    print('{} frames, {:.1f} MiB: unhandled {} bytes each, handled {} bytes each'.format(
+        FRAMES, len(blob) / 2 ** 20, update_size, create_size))
+    for name, touch, options in (
+            ('parse everything', True, dict(prefilter=False)),
+            ('prefilter', True, dict()),
+            ('prefilter + lazy, data used', True, dict(lazy_events=True)),
+            ('prefilter + lazy, data unused', False, dict(lazy_events=True))):
+        elapsed = min(run(blob, touch, **options) for _ in range(3))
+        print('{:<32} {:>10.0f} frames/s  {:>8.1f} MiB/s'.format(
+            name, FRAMES / elapsed, len(blob) / elapsed / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
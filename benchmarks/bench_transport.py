@@ -0,0 +1,105 @@
+# Startup time and per-update latency of a sync Presence on each transport: asyncio (the default), the
+# blocking SocketTransport and, for per-update cost without any I/O, testing.MemoryTransport.
+# The fake Discord runs in its own process so it doesn't share the GIL with the client being measured, and
+# startup is measured in a fresh interpreter: from before `import pypresence` to the first update's reply.
+# Run from the repository root: python benchmarks/bench_transport.py
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+UPDATES = 5000
+STARTS = 10
+
+SERVER = '''
+import asyncio, sys
+from pypresence.testing import FakeDiscordServer
+
+async def main():
+    async with FakeDiscordServer() as server:
+        print(server.ipc_dir, flush=True)
+        await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+
+asyncio.run(main())
+'''
+
+STARTUP = '''
+import time
+start = time.perf_counter()
+from pypresence import Presence
+imported = time.perf_counter()
+if {socket}:
+    from pypresence.transport import SocketTransport
+    rpc = Presence('1', transport=SocketTransport())
+else:
+    rpc = Presence('1')
+rpc.connect()
+rpc.update(state='Starting')
+print(imported - start, time.perf_counter() - start)
+rpc.close()
+'''
+
+
+def presence(kind):
+    from pypresence import Presence
+    from pypresence.testing import MemoryTransport
+    from pypresence.transport import SocketTransport
+    if kind == 'asyncio':
+        return Presence('1')
+    if kind == 'socket':
+        return Presence('1', transport=SocketTransport())
+    return Presence('1', transport=MemoryTransport())
+
+
+def update_latency(kind):
+    rpc = presence(kind)
+    rpc.connect()
+    times = []
+    for i in range(UPDATES):
+        start = time.perf_counter()
+        rpc.update(state='Level {}'.format(i), details='Benchmarking', large_image='logo')
+        times.append(time.perf_counter() - start)
+    rpc.close()
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99)]
+
+
+def startup(kind, env):
+    imports, totals = [], []
+    for _ in range(STARTS):
+        out = subprocess.run([sys.executable, '-c', STARTUP.format(socket=kind == 'socket')], env=env,
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        imported, total = map(float, out.split())
+        imports.append(imported)
+        totals.append(total)
+    return statistics.median(imports), statistics.median(totals)
+
+
+def main():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    server = subprocess.Popen([sys.executable, '-c', SERVER], env=env, cwd=ROOT,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        ipc_dir = server.stdout.readline().strip()
+        os.environ['XDG_RUNTIME_DIR'] = env['XDG_RUNTIME_DIR'] = ipc_dir
+
+        print('{:<8} {:>12} {:>16} {:>14} {:>14}'.format(
+            'transport', 'import ms', 'first update ms', 'update p50 us', 'update p99 us'))
+        for kind in ('asyncio', 'socket', 'memory'):
+            imported, total = startup(kind, env) if kind != 'memory' else (None, None)
+            p50, p99 = update_latency(kind)
+            print('{:<8} {:>12} {:>16} {:>14.1f} {:>14.1f}'.format(
+                kind, '-' if imported is None else '{:.1f}'.format(imported * 1e3),
+                '-' if total is None else '{:.1f}'.format(total * 1e3), p50 * 1e6, p99 * 1e6))
+    finally:
+        server.stdin.close()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
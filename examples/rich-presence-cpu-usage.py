@@ -7,9 +7,13 @@ RPC = Presence(client_id,pipe=0)  # Initialize the client class
 RPC.connect() # Start the handshake loop
 
 
-while True:  # The presence will stay on as long as the program is running
+def usage():  # Called for every refresh, returns the presence to show
     cpu_per = round(psutil.cpu_percent(),1) # Get CPU Usage
-    mem = psutil.virtual_memory()
     mem_per = round(psutil.virtual_memory().percent,1)
-    print(RPC.update(details="RAM: "+str(mem_per)+"%", state="CPU: "+str(cpu_per)+"%"))  # Set the presence
-    time.sleep(15) # Can only update rich presence every 15 seconds
+    return {"details": "RAM: "+str(mem_per)+"%", "state": "CPU: "+str(cpu_per)+"%"}
+
+
+RPC.rotate(usage, interval=15)  # Can only update rich presence every 15 seconds
+
+while True:  # The presence will stay on as long as the program is running
+    time.sleep(60)
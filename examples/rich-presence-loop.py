@@ -1,5 +1,4 @@
 from pypresence import Presence
-import time
 import random
 
 client_id = '64567352374564'  # Put your Client ID here, this is a fake ID
@@ -22,6 +21,8 @@ quotes = [
 ]  # The quotes to choose from
 
 
-while True:  # The presence will stay on as long as the program is running
-    RPC.update(details="Famous Quote:", state=random.choice(quotes)) #Set the presence, picking a random quote
-    time.sleep(60) #Wait a wee bit
+# Pick a new random quote every minute, in the background
+RPC.rotate(lambda: {"details": "Famous Quote:", "state": random.choice(quotes)}, interval=60)
+
+input("Press Enter to stop\n")  # The main thread is free to do anything else meanwhile
+RPC.close()
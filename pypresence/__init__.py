@@ -5,8 +5,10 @@ By: qwertyquerty and LewdNeko
 """
 
 from .baseclient import BaseClient
-from .client import Client
-from .presence import Presence
+from .client import Client, AsyncClient
+from .presence import Presence, AsyncPresence
+from .manager import ConnectionManager
+from .payloads import Activity
 from .exceptions import *
 
 __title__ = 'pypresence'
@@ -1,25 +1,65 @@
+import asyncio
+import concurrent.futures
 import inspect
-import json
+import itertools
+import logging
 import os
-import struct
+import random
 import sys
+import threading
 import time
+import weakref
 
+from .batch import Batch
+from .discovery import candidate_paths, discover, forget as forget_discovery
+from .dispatch import EventDispatcher, LazyData
 from .exceptions import *
+from .metrics import ClientMetrics
+from .payloads import dumps, encode_frame, header, loads
+from .protocol import IPCProtocol, OP_FRAME, OP_PING, OP_PONG, RECEIVED, SENT, peek_dispatch
+from .streams import Event, EventStream
 from .utils import *
 
+WRITE_OVERFLOW_POLICIES = ('block', 'drop_stale', 'raise')
+# what a drop_stale activity update that was replaced before it was written resolves to
+_DROPPED = object()
+
+logger = logging.getLogger(__name__)
+
 
 class BaseClient:
 
-    def __init__(self, client_id, pipe=0, loop=None, handler=None):
+    def __init__(self, client_id, pipe=0, loop=None, handler=None, isasync=False, threaded=False,
+                 event_workers=0, event_queue_size=256, event_overflow='block', handler_executor=None,
+                 reconnect=False, reconnect_delay=0.5, reconnect_max_delay=30, on_reconnect=None,
+                 recorder=None, metrics=True, observer=None, dispatcher=None, io_thread=None,
+                 prefilter=True, lazy_events=False,
+                 write_buffer_limit=64 * 1024, write_overflow='block', write_timeout=None,
+                 heartbeat=None, heartbeat_misses=3, transport=None, connect_timeout=10):
         self.client_id = str(client_id)
+        self.isasync = isasync
+        self.handler = None
         
         self.connected=False
         self.listening=False
         self._events={}
+        # event name -> weak references to the EventStreams reading it, see events(), the subscriptions they made
+        # and those that have paused reading. Held weakly so a stream dropped without close() doesn't block us
+        self._streams = {}
+        self._stream_subscriptions = set()
+        self._stream_pauses = []
         self.oauth_token = None
         
-        if sys.platform == 'linux' or sys.platform == 'darwin':
+        # pipe=None probes every candidate pipe on connect, see discovery.py
+        self.pipe = pipe
+        self.discovery = None
+
+        if pipe is None:
+            if sys.platform not in ('linux', 'darwin', 'win32'):
+                raise PyPresenceException('unsupported platform: {} ({})'
+                                .format(sys.platform, os.name))
+            self.ipc_path = None
+        elif sys.platform == 'linux' or sys.platform == 'darwin':
             # not os.name == 'posix'
             self.ipc_path = (
                                     os.environ.get(
@@ -31,8 +71,7 @@ class BaseClient:
                                 None) or os.environ.get(
                                 'TEMP',
                                 None) or '/tmp') + '/discord-ipc-' + str(pipe)
-            if not os.path.exists(self.ipc_path):
-                raise InvalidPipe("No IPC pipe found. Is Discord running?")
+            # a missing pipe raises InvalidPipe on connect, so a background connect can be started regardless
 
         elif sys.platform == 'win32':
             self.ipc_path = r'\\?\pipe\discord-ipc-' + str(pipe)
@@ -41,15 +80,109 @@ class BaseClient:
             raise PyPresenceException('unsupported platform: {} ({})'
                             .format(sys.platform, os.name))
 
+        # io_thread is a thread already running loop that this client shares, see manager.py
+        threaded = threaded or io_thread is not None
+        if write_overflow not in WRITE_OVERFLOW_POLICIES:
+            raise PyPresenceException('write_overflow must be one of {}'.format(', '.join(WRITE_OVERFLOW_POLICIES)))
+        if isasync and threaded:
+            raise PyPresenceException('Async clients run on the caller\'s loop and can\'t be threaded.')
+        if reconnect and not (isasync or threaded):
+            raise PyPresenceException('Reconnecting needs a running loop, use threaded=True or an async client.')
+        if heartbeat and not (isasync or threaded):
+            raise PyPresenceException('Heartbeats need a running loop, use threaded=True or an async client.')
+        # a blocking transport instead of asyncio, see transport.py
+        self.transport = transport
+        if transport is not None and (isasync or threaded or reconnect or heartbeat or event_workers
+                                      or handler_executor is not None or loop is not None):
+            raise PyPresenceException('A blocking transport has no event loop, so it can\'t be used with '
+                                      'async, threaded, reconnect, heartbeat, event_workers or handler_executor.')
+
+        # close() only closes a loop this client made itself
+        self._owns_loop = False
         if loop is not None:
             self.loop = loop
+        elif transport is not None:
+            self.loop = None
+        elif io_thread is not None:
+            raise PyPresenceException('io_thread needs the loop it is running.')
+        elif isasync:
+            # picked up from the running loop on connect
+            self.loop = None
+        elif threaded:
+            self.loop = asyncio.new_event_loop()
+            self._owns_loop = True
         elif sys.platform == 'linux' or sys.platform == 'darwin':
             self.loop = asyncio.get_event_loop()
         elif sys.platform == 'win32':
             self.loop = asyncio.ProactorEventLoop()
+            self._owns_loop = True
+
+        self.sock_writer: asyncio.Transport = None
+        self._protocol: IPCProtocol = None
+        self._handshake_waiter = None
+        self._lost = None
+
+        # requests in flight, keyed by nonce; resolved as their replies arrive
+        self._nonces = itertools.count(1)
+        self._pending = {}
+        self._unsolicited_waiters = []
+
+        # a FlightRecorder, see recorder.py
+        self.recorder = recorder
+        self.metrics = ClientMetrics(observer, self._exception) if metrics or observer is not None else None
+
+        # a shared dispatcher belongs to whoever passed it in, and is closed by them
+        self._owns_dispatcher = dispatcher is None
+        if dispatcher is None:
+            dispatcher = EventDispatcher(self, event_workers, event_queue_size, event_overflow, handler_executor)
+        self._dispatcher = dispatcher
+        # look at a DISPATCH frame's evt before parsing it, and skip the parsing if nobody wants the event
+        self.prefilter = prefilter
+        # handlers get a LazyData that parses the frame on first use instead of a dict
+        self.lazy_events = lazy_events
+        # the dispatcher and each stream can pause reading, it resumes once none of them wants it paused
+        self._read_pauses = 0
 
-        self.sock_reader: asyncio.StreamReader = None
-        self.sock_writer: asyncio.StreamWriter = None
+        # outbound flow control: past write_buffer_limit unsent bytes the transport pauses us until it has
+        # drained to a quarter of that, and requests wait, fail or replace each other as write_overflow says
+        self.write_buffer_limit = write_buffer_limit
+        self.write_overflow = write_overflow
+        self.write_timeout = write_timeout
+        self._write_paused = False
+        self._drain_waiter = None
+        self._held_activity = None
+
+        # session state replayed after a reconnect
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.on_reconnect = on_reconnect
+        self.reconnects = 0
+        self.last_recovery_time = None
+        self._reconnect_task = None
+        self._closing = False
+        self._auth_args = None
+        self._subscriptions = {}
+        self._last_activity = None
+
+        # a handshake running in the background, see connect(block=False). Requests made meanwhile wait up to
+        # connect_timeout seconds for it, except activity updates: the latest is held and sent once connected
+        self._connecting = None
+        self.connect_timeout = connect_timeout
+        self._early_activity = None
+
+        # a PING every heartbeat seconds, and the connection is dropped after heartbeat_misses go unanswered.
+        # rtt is the last round trip in seconds, smoothed_rtt and rtt_jitter are averaged as TCP does (RFC 6298)
+        self.heartbeat = heartbeat
+        self.heartbeat_misses = heartbeat_misses
+        self.rtt = None
+        self.smoothed_rtt = None
+        self.rtt_jitter = None
+        self.missed_pongs = 0
+        self.heartbeat_failures = 0
+        self._heartbeat_task = None
+        self._pings = itertools.count(1)
+        self._ping = None
 
         if handler is not None:
             if not inspect.isfunction(handler):
@@ -59,118 +192,770 @@ class BaseClient:
             if len(args) != 2:
                 raise PyPresenceException('Error handler should only accept two arguments.')
 
-            loop.set_exception_handler(self._err_handle)
             self.handler = handler
+            if self.loop is not None:
+                self.loop.set_exception_handler(self._err_handle)
+
+        self._thread = io_thread
+        self._owns_thread = False
+        if threaded and io_thread is None:
+            self._start_thread()
+
+    def _start_thread(self):
+        # the loop, the pipe and every event handler live on this thread from now on
+        self._thread = threading.Thread(target=self.loop.run_forever, name='pypresence-io', daemon=True)
+        self._owns_thread = True
+        self._thread.start()
+
+    def _stop_thread(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+        self._owns_thread = False
 
     def _err_handle(self, loop, context):
         if inspect.iscoroutinefunction(self.handler):
-            loop.run_until_complete(self.handler(context['exception'], context['future']))
+            loop.create_task(self.handler(context.get('exception'), context.get('future')))
         else:
-            self.handler(context['exception'], context['future'])
+            self.handler(context.get('exception'), context.get('future'))
 
-    async def read_output(self):
-        # see https://github.com/discordapp/discord-rpc/blob/master/documentation/hard-mode.md
+    def _on_frame(self, op, payload):
+        # called by IPCProtocol for every complete frame, payload is only valid during the call
+        if self.recorder is not None:
+            self.recorder.record(RECEIVED, op, payload)
+        if self.metrics is not None:
+            self.metrics.frames_received[op] += 1
+            self.metrics.bytes_received[op] += len(payload) + 8
+        if op == OP_PING:
+            self._write(header.pack(OP_PONG, len(payload)) + payload)
+            return
+        if op == OP_PONG:
+            self._pong(payload)
+            return
+        if op == OP_FRAME and self.prefilter and self._handshake_waiter is None and not self._unsolicited_waiters:
+            evt = peek_dispatch(payload)
+            if evt is not None:
+                self._event_seen(evt)
+                handler = self._events.get(evt, None)
+                streams = self._streams.get(evt, None)
+                if not handler and not streams:
+                    if self.metrics is not None:
+                        self.metrics.skipped[evt] += 1
+                    return
+                if self.lazy_events:
+                    self._deliver(evt, handler, streams, LazyData(bytes(payload)))
+                else:
+                    response = self._loads(payload)
+                    if response is not None:
+                        self._deliver(evt, handler, streams, response["data"])
+                return
+        response = self._loads(payload)
+        if response is None:
+            return
+
+        waiter = self._handshake_waiter
+        if waiter is not None:
+            self._handshake_waiter = None
+            if not waiter.done():
+                waiter.set_result(response)
+        elif op == OP_FRAME:
+            self._route(response)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if self._ping is not None:
+                self.missed_pongs += 1
+                if self.missed_pongs >= self.heartbeat_misses:
+                    # Discord is hung: drop the connection now rather than wait for the OS to notice
+                    self.heartbeat_failures += 1
+                    self._heartbeat_task = None
+                    self.sock_writer.abort()
+                    return
+            nonce = str(next(self._pings))
+            self._ping = (nonce, self.loop.time())
+            self.send_data(OP_PING, {'nonce': nonce})
+
+    def _pong(self, payload):
+        # any PONG shows Discord is alive, only the one for the latest PING is timed
+        self.missed_pongs = 0
+        ping, self._ping = self._ping, None
+        if ping is None:
+            return
+        response = self._loads(payload)
+        if not isinstance(response, dict) or response.get('nonce', None) != ping[0]:
+            return
+        rtt = self.loop.time() - ping[1]
+        self.rtt = rtt
+        if self.smoothed_rtt is None:
+            self.smoothed_rtt = rtt
+            self.rtt_jitter = rtt / 2
+        else:
+            self.rtt_jitter = 0.75 * self.rtt_jitter + 0.25 * abs(self.smoothed_rtt - rtt)
+            self.smoothed_rtt = 0.875 * self.smoothed_rtt + 0.125 * rtt
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        self._ping = None
+        self.missed_pongs = 0
+
+    def _loads(self, payload):
+        try:
+            return loads(payload)
+        except Exception as err:
+            self._exception({
+                'message': 'Undecodable frame from Discord',
+                'exception': err,
+            })
+            return None
+
+    def _exception(self, context):
+        # loop.call_exception_handler, also for clients with a blocking transport and so no loop
+        if self.loop is not None:
+            self.loop.call_exception_handler(context)
+        elif self.handler is not None and not inspect.iscoroutinefunction(self.handler):
+            self.handler(context.get('exception'), None)
+        else:
+            _default_exception_handler(context)
+
+    def _pause_writing(self):
+        self._write_paused = True
+
+    def _resume_writing(self):
+        self._write_paused = False
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        held, self._held_activity = self._held_activity, None
+        if held is not None and not held[1].done():
+            self._write(held[0])
+
+    async def _writable(self):
+        # wait for the transport to drain below its low water mark, or fail as write_overflow says
+        if self.write_overflow == 'raise':
+            raise WriteBufferFull
+        if self._drain_waiter is None:
+            self._drain_waiter = self.loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._drain_waiter), self.write_timeout)
+        except asyncio.TimeoutError:
+            raise WriteBufferFull from None
+
+    async def _send(self, cmd, frame, future):
+        if not self._write_paused:
+            self._write(frame)
+        elif self.write_overflow == 'drop_stale' and cmd == "SET_ACTIVITY":
+            # only the newest activity is worth sending once Discord reads again, the one it replaces is dropped
+            if self._held_activity is not None and not self._held_activity[1].done():
+                self._held_activity[1].set_result(_DROPPED)
+            self._held_activity = (frame, future)
+        else:
+            await self._writable()
+            self._write(frame)
+
+    def _connection_lost(self, exc):
+        was_connected, self.connected = self.connected, False
+        self._stop_heartbeat()
+        self._write_paused = False
+        self._held_activity = None
+        if self._drain_waiter is not None:
+            if not self._drain_waiter.done():
+                self._drain_waiter.set_exception(InvalidPipe())
+            self._drain_waiter = None
+        waiters = list(self._pending.values()) + self._unsolicited_waiters
+        self._pending = {}
+        self._unsolicited_waiters = []
+        if self._handshake_waiter is not None:
+            waiters.append(self._handshake_waiter)
+            self._handshake_waiter = None
+        for future in waiters:
+            if not future.done():
+                future.set_exception(InvalidPipe())
+        if self._lost is not None and not self._lost.done():
+            self._lost.set_result(exc)
+        if self.reconnect and was_connected and not self._closing and self._reconnect_task is None:
+            self._reconnect_task = self.loop.create_task(self._reconnect())
+        if self._reconnect_task is None:
+            self._end_streams()
+
+    async def _reconnect(self):
+        lost_at = self.loop.time()
+        delay = self.reconnect_delay
+        try:
+            while True:
+                # equal jitter, so a crowd of clients doesn't hit a restarted Discord all at once
+                await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+                try:
+                    await self.handshake()
+                except InvalidID:
+                    raise
+                except (PyPresenceException, OSError):
+                    pass
+                if self.connected:
+                    break
+                delay = min(delay * 2, self.reconnect_max_delay)
+            await self._replay()
+        finally:
+            self._reconnect_task = None
+
+        self.reconnects += 1
+        self.last_recovery_time = self.loop.time() - lost_at
+        if self.metrics is not None:
+            self.metrics.reconnect(self.last_recovery_time)
+        if self.on_reconnect is not None:
+            try:
+                self.on_reconnect(self.last_recovery_time)
+            except Exception as err:
+                self.loop.call_exception_handler({
+                    'message': 'Exception in on_reconnect callback',
+                    'exception': err,
+                })
+
+    async def _replay(self):
+        # authentication, subscriptions and the last activity, written to the pipe in one go
+        commands = []
+        if self._auth_args is not None:
+            commands.append(("AUTHENTICATE", self._auth_args, None))
+        for evt, args in self._subscriptions.values():
+            commands.append(("SUBSCRIBE", args, evt))
+        if self._last_activity is not None:
+            commands.append(("SET_ACTIVITY", self._last_activity, None))
+        for result in await self._request_many(commands):
+            if isinstance(result, Exception):
+                self.loop.call_exception_handler({
+                    'message': 'Failed to restore session state after reconnecting',
+                    'exception': result,
+                })
+
+    def _remember(self, cmd, args, evt):
+        # keep what a reconnect has to restore
+        if cmd == "SET_ACTIVITY":
+            self._last_activity = args
+        elif cmd == "SUBSCRIBE":
+            self._subscriptions[(evt, dumps(args))] = (evt, args)
+        elif cmd == "UNSUBSCRIBE":
+            self._subscriptions.pop((evt, dumps(args)), None)
+        elif cmd == "AUTHENTICATE":
+            self._auth_args = args
+
+    def _route(self, response):
+        future = self._pending.pop(response.get("nonce", None), None)
+        if future is not None:
+            if future.done():
+                return
+            if response.get("evt", None) == "ERROR":
+                future.set_exception(ServerError(response["data"]["message"]))
+            else:
+                future.set_result(response)
+            return
+
+        waiters, self._unsolicited_waiters = self._unsolicited_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(response)
+
+        if response.get("cmd", None) == "DISPATCH":
+            evt = response.get("evt", None)
+            self._event_seen(evt)
+            self._deliver(evt, self._events.get(evt, None), self._streams.get(evt, None), response["data"])
+
+    def _deliver(self, evt, handler, streams, data):
+        # one data object for the handler and every stream, nothing is copied
+        if handler:
+            self._dispatcher.dispatch(evt, handler, data)
+        if streams:
+            event = Event(evt, data)
+            for ref in streams:
+                stream = ref()
+                if stream is not None:
+                    stream._put(event)
+
+    def _event_seen(self, evt):
+        # every DISPATCH passes here once, whether it gets parsed or not
+        if self.metrics is not None:
+            self.metrics.events[evt] += 1
+
+    def _pause_reading(self):
+        self._read_pauses += 1
+        if self._read_pauses == 1 and self.sock_writer is not None and not self.sock_writer.is_closing():
+            self.sock_writer.pause_reading()
+
+    def _resume_reading(self):
+        self._read_pauses -= 1
+        if self._read_pauses == 0 and self.sock_writer is not None and not self.sock_writer.is_closing():
+            self.sock_writer.resume_reading()
+
+    def _run(self, coro):
+        # sync clients drive their own loop or submit to the I/O thread, async ones hand the coroutine back
+        if self.isasync:
+            return coro
+        if self.transport is not None:
+            return _run_blocking(coro)
+        if self._thread is not None:
+            if threading.current_thread() is self._thread:
+                coro.close()
+                raise PyPresenceException('Blocking calls can\'t be made from the I/O thread, e.g. in an event handler.')
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        return self.loop.run_until_complete(coro)
+
+    def _new_future(self):
+        return self.loop.create_future() if self.transport is None else concurrent.futures.Future()
+
+    def _read_frame(self, idle=False):
+        # blocking transport: read one frame and handle it like IPCProtocol would
+        try:
+            op, payload = self.transport.read_frame(idle)
+        except (InvalidPipe, ConnectionTimeout):
+            self._connection_lost(None)
+            raise
+        self._on_frame(op, payload)
+
+    def _read_until(self, future):
+        while not future.done():
+            self._read_frame()
+
+    def _write_blocking(self, frames):
+        try:
+            self._writelines(frames)
+        except (InvalidPipe, ConnectionTimeout):
+            self._connection_lost(None)
+            raise
+
+    def _read_pending(self):
+        # whatever Discord sent since the last call, without waiting for more
+        while self.connected and self.transport.readable():
+            self._read_frame()
+
+    def _command(self, command, args):
+        # every method generated from the command table in payloads.py ends up here
+        return self._run(self.request(command.cmd, args))
+
+    def _next_nonce(self):
+        return str(next(self._nonces))
+
+    async def request(self, cmd, args=None, evt=None):
+        if not self.connected:
+            if self._connecting is None:
+                raise InvalidPipe
+            if cmd == "SET_ACTIVITY" or cmd == "CLEAR_ACTIVITY":
+                # nothing to wait for: the latest is sent once connected, see _connect_in_background
+                self._early_activity = (cmd, args)
+                return None
+            await self._until_connected()
+        if args is None:
+            args = {}
+        if self.transport is not None:
+            return self._blocking_request(cmd, args, evt)
+        nonce = self._next_nonce()
+        future = self.loop.create_future()
+        self._pending[nonce] = future
+        start = time.perf_counter()
+        try:
+            await self._send(cmd, encode_frame(cmd, args, nonce, evt), future)
+            response = await future
+        except PyPresenceException:
+            if self.metrics is not None:
+                self.metrics.command(cmd, time.perf_counter() - start, ok=False)
+            raise
+        finally:
+            self._pending.pop(nonce, None)
+        if response is _DROPPED:
+            # never reached Discord: not a round trip, and not what a reconnect should restore
+            return None
+        if self.metrics is not None:
+            self.metrics.command(cmd, time.perf_counter() - start)
+        self._remember(cmd, args, evt)
+        return response
+
+    def _blocking_request(self, cmd, args, evt):
+        nonce = self._next_nonce()
+        future = self._pending[nonce] = concurrent.futures.Future()
+        start = time.perf_counter()
+        try:
+            self._write_blocking([encode_frame(cmd, args, nonce, evt)])
+            self._read_until(future)
+            response = future.result()
+        except PyPresenceException:
+            if self.metrics is not None:
+                self.metrics.command(cmd, time.perf_counter() - start, ok=False)
+            raise
+        finally:
+            self._pending.pop(nonce, None)
+        if self.metrics is not None:
+            self.metrics.command(cmd, time.perf_counter() - start)
+        self._remember(cmd, args, evt)
+        return response
+
+    async def _request_many(self, commands):
+        # several (cmd, args, evt) requests in one write, gives a result or an exception per command
+        if not self.connected:
+            raise InvalidPipe
+        frames = []
+        nonces = []
+        futures = []
+        for cmd, args, evt in commands:
+            nonce = self._next_nonce()
+            future = self._new_future()
+            self._pending[nonce] = future
+            frames.append(encode_frame(cmd, {} if args is None else args, nonce, evt))
+            nonces.append(nonce)
+            futures.append(future)
+        if self.metrics is not None:
+            start = time.perf_counter()
+            for (cmd, args, evt), future in zip(commands, futures):
+                future.add_done_callback(lambda future, cmd=cmd: self._timed(cmd, start, future))
+        try:
+            if self.transport is not None:
+                self._write_blocking(frames)
+                for future in futures:
+                    self._read_until(future)
+                results = [future.exception() or future.result() for future in futures]
+            else:
+                if self._write_paused:
+                    await self._writable()
+                self._writelines(frames)
+                results = await asyncio.gather(*futures, return_exceptions=True)
+        finally:
+            for nonce in nonces:
+                self._pending.pop(nonce, None)
+        for (cmd, args, evt), result in zip(commands, results):
+            if not isinstance(result, BaseException):
+                self._remember(cmd, {} if args is None else args, evt)
+        return results
+
+    def batch(self):
+        return Batch(self)
+
+    def _connect(self, block):
+        if block:
+            return self._run(self.handshake())
+        if self.transport is not None:
+            raise PyPresenceException('Connecting in the background needs an event loop, not a blocking transport.')
+        if self.isasync:
+            if self.loop is None:
+                self.loop = asyncio.get_running_loop()
+            return self._start_connecting()
+        if self._thread is None:
+            # nothing would run the handshake once this returns
+            self._start_thread()
+        return asyncio.run_coroutine_threadsafe(self._wait_connecting(), self.loop)
 
+    def _start_connecting(self):
+        if self._connecting is None:
+            self._connecting = self.loop.create_task(self._connect_in_background())
+        return self._connecting
+
+    async def _wait_connecting(self):
+        return await self._start_connecting()
+
+    async def _connect_in_background(self):
         try:
-            message_header = await self.sock_reader.readexactly(8)
-            code, length = struct.unpack('<II', message_header)
-            payload = await self.sock_reader.readexactly(length)
-        except BrokenPipeError:
-            self.connected=False
+            response = await self.handshake()
+        except BaseException:
+            self._early_activity = None
+            raise
+        finally:
+            self._connecting = None
+        early, self._early_activity = self._early_activity, None
+        if early is not None:
+            self.loop.create_task(self.request(*early)).add_done_callback(self._early_sent)
+        self._ready()
+        return response
+
+    def _early_sent(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self._exception({
+                'message': 'Failed to send the activity set while connecting',
+                'exception': task.exception(),
+            })
+
+    def _ready(self):
+        # the background handshake is done and the requests waiting for it are about to go out
+        pass
+
+    async def _until_connected(self):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._connecting), self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionTimeout from None
+        if not self.connected:
             raise InvalidPipe
-        assert length==len(payload)
-        parsed=json.loads(payload.decode('utf-8'))
+        return False
+
+    def _timed(self, cmd, start, future):
+        if not future.cancelled():
+            self.metrics.command(cmd, time.perf_counter() - start, ok=future.exception() is None)
+
+    def stats(self):
+        # a snapshot of the client's metrics, safe to call from any thread
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            return asyncio.run_coroutine_threadsafe(self._stats(), self.loop).result()
+        return self._snapshot()
+
+    async def _stats(self):
+        return self._snapshot()
+
+    def _snapshot(self):
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {}
+        transport = self.sock_writer
+        snapshot.update(
+            connected=self.connected,
+            outbound_buffer=transport.get_write_buffer_size() if transport is not None and not transport.is_closing() else 0,
+            write_paused=self._write_paused,
+            queued_events=self._dispatcher.queued(),
+            dropped_events=self._dispatcher.dropped,
+            reconnects=self.reconnects,
+            last_recovery_time=self.last_recovery_time,
+            rtt=self.rtt,
+            smoothed_rtt=self.smoothed_rtt,
+            rtt_jitter=self.rtt_jitter,
+            missed_pongs=self.missed_pongs,
+            heartbeat_failures=self.heartbeat_failures,
+        )
+        return snapshot
+
+    async def read_output(self):
+        # next frame that isn't the reply to one of our requests
+        if not self.connected:
+            raise InvalidPipe
+        future = self._new_future()
+        self._unsolicited_waiters.append(future)
+        if self.transport is not None:
+            self._read_until(future)
+            parsed = future.result()
+        else:
+            parsed = await future
         if parsed.get("evt", None)=="ERROR":
             raise ServerError(parsed["data"]["message"])
         return parsed
 
     def callback(self, event="NOTIFICATION_CREATE", **args):
         def register_inner(func):
-            self.register_event(event, func, args)
+            registration = self.register_event(event, func, args)
+            if self.isasync:
+                # nobody awaits a decorator, so the registration runs as a task on the client's loop
+                if self.loop is None:
+                    registration.close()
+                    raise PyPresenceException('Connect an async client before using callback(), '
+                                              'or await register_event() instead.')
+                self.loop.create_task(registration).add_done_callback(self._registered)
+            return func
         return register_inner
+
+    def _registered(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self._exception({
+                'message': 'Failed to register a callback() handler',
+                'exception': task.exception(),
+            })
     
     def register_event(self, event: str, func, args={}):
-        event=event.upper()
-        if inspect.iscoroutinefunction(func):
-            raise NotImplementedError
-        elif len(inspect.signature(func).parameters) != 1:
+        if len(inspect.signature(func).parameters) != 1:
             raise ArgumentError
-        self.subscribe(event, args)
+        if self.transport is not None and inspect.iscoroutinefunction(func):
+            raise PyPresenceException('Coroutine handlers need an event loop, not a blocking transport.')
+        return self._run(self._register_event(event.upper(), func, args))
+
+    async def _register_event(self, event, func, args):
+        # register first so events sent right after the subscription aren't missed
         self._events[event] = func
+        try:
+            await self.request("SUBSCRIBE", args, event)
+        except Exception:
+            del self._events[event]
+            raise
 
     def unregister_event(self, event: str, args={}):
         event=event.upper()
         if event not in self._events:
-            raise EventNotFound
-        self.unsubscribe(event, args)
+            raise EventNotFound(event)
+        return self._run(self._unregister_event(event, args))
+
+    async def _unregister_event(self, event, args):
+        # a stream may still be reading the event
+        if not self._streams.get(event, None):
+            await self.request("UNSUBSCRIBE", args, event)
         del self._events[event]
 
+    def events(self, *names, predicate=None, maxsize=256, overflow='block', args=None):
+        if self.transport is not None:
+            raise PyPresenceException('Event streams need an event loop, not a blocking transport.')
+        return EventStream(self, names, predicate, maxsize, overflow, args)
+
+    def _add_stream(self, stream):
+        ref = weakref.ref(stream)
+        for name in stream.names:
+            self._streams[name] = self._streams.get(name, ()) + (ref,)
+        return ref
+
+    def _stream_blocked(self, ref):
+        self._stream_pauses.append(ref)
+        self._pause_reading()
+
+    def _stream_unblocked(self, ref):
+        # by identity: a dead weak reference can't always be hashed or compared
+        for index, paused in enumerate(self._stream_pauses):
+            if paused is ref:
+                del self._stream_pauses[index]
+                self._resume_reading()
+                return
+
+    async def _subscribe_stream(self, stream):
+        # subscribes to those of the stream's events that aren't subscribed to yet
+        key = dumps(stream.args)
+        names = [name for name in stream.names if (name, key) not in self._subscriptions]
+        if names:
+            for name, result in zip(names, await self._request_many(
+                    [("SUBSCRIBE", stream.args, name) for name in names])):
+                if isinstance(result, Exception):
+                    raise result
+                self._stream_subscriptions.add((name, key))
+        return True
+
+    async def _remove_stream(self, stream):
+        unused = self._forget_stream(stream._ref, stream.names, stream.args)
+        if unused and self.connected:
+            await self._request_many([("UNSUBSCRIBE", stream.args, name) for name in unused])
+
+    def _forget_stream(self, ref, names, args):
+        # stops delivering to a stream, and returns the events streams subscribed to that nothing reads any more
+        self._stream_unblocked(ref)
+        key = dumps(args)
+        unused = []
+        for name in names:
+            streams = tuple(other for other in self._streams.get(name, ()) if other is not ref)
+            if streams:
+                self._streams[name] = streams
+                continue
+            self._streams.pop(name, None)
+            if (name, key) in self._stream_subscriptions and name not in self._events:
+                self._stream_subscriptions.discard((name, key))
+                unused.append(name)
+        return unused
+
+    def _stream_collected(self, ref, names, args):
+        # a stream was dropped without close(), e.g. by leaving an async for early; may run on any thread
+        if self.loop is None or self.loop.is_closed():
+            self._forget_stream(ref, names, args)
+            return
+        self.loop.call_soon_threadsafe(self._collect_stream, ref, names, args)
+
+    def _collect_stream(self, ref, names, args):
+        unused = self._forget_stream(ref, names, args)
+        if unused and self.connected:
+            task = self.loop.create_task(self._request_many([("UNSUBSCRIBE", args, name) for name in unused]))
+            task.add_done_callback(_retrieved)
+
+    def _end_streams(self):
+        for streams in list(self._streams.values()):
+            for ref in streams:
+                stream = ref()
+                if stream is not None:
+                    stream._end()
+
     def subscribe(self, event, args={}):
-        current_time = time.time()
-        payload = {
-            "cmd": "SUBSCRIBE",
-            "args": args,
-            "evt": event.upper(),
-            "nonce": '{:.20f}'.format(current_time)
-        }
-        sent = self.send_data(1, payload)
-        return self.loop.run_until_complete(self.read_output())
+        return self._run(self.request("SUBSCRIBE", args, event.upper()))
     
     def unsubscribe(self, event, args={}):
-        current_time = time.time()
-        payload = {
-            "cmd": "UNSUBSCRIBE",
-            "args": args,
-            "evt": event.upper(),
-            "nonce": '{:.20f}'.format(current_time)
-        }
-        sent = self.send_data(1, payload)
-        return self.loop.run_until_complete(self.read_output())
+        return self._run(self.request("UNSUBSCRIBE", args, event.upper()))
     
     async def respond_to_events(self):
+        # events are dispatched as frames arrive, this just keeps the loop running until the pipe closes
         self.listening=True
         try:
-            while self.connected and self.listening:
-                event_json = await self.read_output()
-                if event_json.get("cmd", None) == "DISPATCH":
-                    evt=event_json.get("evt", None)
-                    handler = self._events.get(evt, None)
-                    if handler:
-                        handler(event_json["data"])
-        except InvalidPipe:    
-            if self.sock_reader._eof:
-                return
+            if self.transport is not None:
+                # handle events as they come until the pipe closes
+                while self.connected:
+                    try:
+                        self._read_frame(idle=True)
+                    except (InvalidPipe, ConnectionTimeout):
+                        break
+            while self._lost is not None:
+                await asyncio.shield(self._lost)
+                if self._reconnect_task is None:
+                    break
+                await asyncio.shield(self._reconnect_task)
         finally:
             self.listening=False
 
     def send_data(self, op: int, payload: dict):
-        payload = json.dumps(payload).encode('utf-8')
+        payload = dumps(payload)
         length=len(payload)
         # encode first, then take length, because of multibyte code points
-        self.sock_writer.write(
-            struct.pack(
-                '<II',
-                op,
-                length)
-            + payload)
+        self._write(header.pack(op, length) + payload)
+
+    def _write(self, frame):
+        # every frame we send goes through here or _writelines
+        if self.recorder is not None:
+            self.recorder.record_frame(SENT, frame)
+        if self.metrics is not None:
+            self.metrics.frames_sent[frame[0]] += 1
+            self.metrics.bytes_sent[frame[0]] += len(frame)
+        self.sock_writer.write(frame)
+
+    def _writelines(self, frames):
+        if self.recorder is not None:
+            for frame in frames:
+                self.recorder.record_frame(SENT, frame)
+        if self.metrics is not None:
+            for frame in frames:
+                self.metrics.frames_sent[frame[0]] += 1
+                self.metrics.bytes_sent[frame[0]] += len(frame)
+        self.sock_writer.writelines(frames)
 
     async def handshake(self):
-        if sys.platform == 'linux' or sys.platform == 'darwin':
-            try:
-                self.sock_reader, self.sock_writer = await asyncio.open_unix_connection(self.ipc_path, loop=self.loop)
-            except ConnectionRefusedError as err:
-                raise InvalidPipe
-        elif sys.platform == 'win32':
-            self.sock_reader = asyncio.StreamReader(loop=self.loop)
-            reader_protocol = asyncio.StreamReaderProtocol(
-                self.sock_reader, loop=self.loop)
+        if self.transport is not None:
+            return self._blocking_handshake()
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            if self.handler is not None:
+                self.loop.set_exception_handler(self._err_handle)
+
+        if self.pipe is None:
+            self.discovery = await discover()
+            self.ipc_path = self.discovery.path
+
+        factory = lambda: IPCProtocol(self)
+        try:
+            if sys.platform == 'linux' or sys.platform == 'darwin':
+                self.sock_writer, self._protocol = await self.loop.create_unix_connection(factory, self.ipc_path)
+            elif sys.platform == 'win32':
+                self.sock_writer, self._protocol = await self.loop.create_pipe_connection(factory, self.ipc_path)
+        except (ConnectionRefusedError, FileNotFoundError) as err:
+            if self.pipe is None and self.discovery.cached:
+                # Discord moved to another pipe since we last looked
+                forget_discovery()
+                return await self.handshake()
+            raise InvalidPipe
+        if self.write_buffer_limit is not None:
+            self.sock_writer.set_write_buffer_limits(self.write_buffer_limit, self.write_buffer_limit // 4)
+        self._lost = self.loop.create_future()
+        self._handshake_waiter = self.loop.create_future()
+        self.send_data(0, {'v': 1, 'client_id': self.client_id})
+
+        response = await self._handshake_waiter
+        return self._handshaken(response)
+
+    def _blocking_handshake(self):
+        # pipe=None tries every candidate in turn, there's nothing to probe them at once with
+        for path in [self.ipc_path] if self.pipe is not None else candidate_paths():
             try:
-                self.sock_writer, _ = await self.loop.create_pipe_connection(lambda: reader_protocol, self.ipc_path)
-            except FileNotFoundError as err:
-                raise InvalidPipe
+                self.transport.open(path)
+            except InvalidPipe:
+                continue
+            self.ipc_path = path
+            break
+        else:
+            raise InvalidPipe
+        self.sock_writer = self.transport
+        waiter = self._handshake_waiter = concurrent.futures.Future()
         self.send_data(0, {'v': 1, 'client_id': self.client_id})
+        self._read_until(waiter)
+        return self._handshaken(waiter.result())
 
-        response = await self.read_output()
+    def _handshaken(self, response):
         if "code" in response:
             # see https://discordapp.com/developers/docs/topics/opcodes-and-status-codes#rpc-rpc-close-event-codes
             if response["code"] == 4000:
@@ -183,11 +968,65 @@ class BaseClient:
             self.config_data=response["data"]["config"]
             self.user_data=response["data"]["user"]
             self.connected=True
+            if self.heartbeat and self._heartbeat_task is None:
+                self._heartbeat_task = self.loop.create_task(self._heartbeat())
 
             return response
-        
-    def close(self):
-        self.send_data(2, {'v': 1, 'client_id': self.client_id})
-        self.sock_writer.close()
+
+    async def _close(self):
+        self._closing = True
+        self._early_activity = None
+        self._stop_heartbeat()
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+        if self.connected:
+            try:
+                self.send_data(2, {'v': 1, 'client_id': self.client_id})
+            except (InvalidPipe, ConnectionTimeout):
+                # a blocking transport found the pipe gone
+                pass
+        if self.sock_writer is not None:
+            self.sock_writer.close()
+            if self._lost is not None:
+                await self._lost
+            else:
+                self._connection_lost(None)
+        if self._owns_dispatcher:
+            await self._dispatcher.close()
+        self._end_streams()
         self.connected = False
-        self.loop.close()
+
+    def close(self):
+        if self.isasync:
+            # the loop belongs to the caller, leave it running
+            return self._close()
+        try:
+            self._run(self._close())
+        finally:
+            if self._owns_thread:
+                self._stop_thread()
+        if self._owns_loop:
+            self.loop.close()
+
+
+def _default_exception_handler(context):
+    # what asyncio's default handler does for a loop, for clients without one
+    err = context.get('exception')
+    logger.error(context['message'], exc_info=(type(err), err, err.__traceback__) if err is not None else None)
+
+
+def _retrieved(task):
+    # nobody waits for the task, and what it does is best effort: don't warn about its exception
+    if not task.cancelled():
+        task.exception()
+
+
+def _run_blocking(coro):
+    # with a blocking transport nothing is ever awaited that isn't done already, so one step runs the coroutine
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise PyPresenceException('This needs an event loop, it can\'t be used with a blocking transport.')
@@ -0,0 +1,66 @@
+from .exceptions import *
+from .payloads import CLIENT_COMMANDS
+
+# Commands queued in a batch go out in one write when the block ends, and their replies are awaited together.
+#
+#     with client.batch() as batch:
+#         for channel in channels:
+#             batch.get_channel(channel['id'])
+#     for result in batch.results:
+#         ...   # the reply, the same as the method would return, or the exception it failed with
+#
+# Async clients use `async with client.batch() as batch:` the same way.
+
+
+class Batch:
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.results = None
+
+    def _command(self, command, args):
+        # queue instead of sending, returns the command's index in results
+        return self.request(command.cmd, args)
+
+    def request(self, cmd, args=None, evt=None):
+        if self.results is not None:
+            raise PyPresenceException('This batch has already been sent.')
+        self.commands.append((cmd, {} if args is None else args, evt))
+        return len(self.commands) - 1
+
+    def subscribe(self, event, args={}):
+        return self.request("SUBSCRIBE", args, event.upper())
+
+    def unsubscribe(self, event, args={}):
+        return self.request("UNSUBSCRIBE", args, event.upper())
+
+    def flush(self):
+        return self.client._run(self._flush())
+
+    async def _flush(self):
+        commands, self.commands = self.commands, []
+        self.results = await self.client._request_many(commands) if commands else []
+        return self.results
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # nothing is sent if the block raised
+        if exc_type is None:
+            self.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self._flush()
+
+
+for _name, _command in CLIENT_COMMANDS.items():
+    setattr(Batch, _name, _command.method(_name))
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import os
+import socket
+import sys
+
+from .exceptions import *
+from .payloads import Activity, dumps, loads
+from .presence import AsyncPresence
+
+# One process owns the connection to Discord, any number of others contribute to the activity it shows.
+#
+#     python -m pypresence.broker CLIENT_ID            # or PresenceBroker(client_id) in your own loop
+#
+#     publisher = PresencePublisher(client_id)         # in every worker
+#     publisher.publish(state='Rendering', party_size=[3, 8])
+#
+# Every publish is one datagram on a local socket holding only the fields that changed. The broker merges them
+# into one activity, ignores those that change nothing and sends the result at most once per interval.
+# A publisher never waits: if the broker isn't running or can't keep up, the fields are kept and go out merged
+# with the next publish, or with flush().
+
+
+def default_path(client_id):
+    base = (os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or os.environ.get('TMP')
+            or os.environ.get('TEMP') or '/tmp')
+    return os.path.join(base, 'pypresence-broker-' + str(client_id))
+
+
+class PresencePublisher:
+
+    def __init__(self, client_id=None, path=None):
+        if path is None:
+            if client_id is None:
+                raise PyPresenceException('PresencePublisher needs a client_id or a path.')
+            path = default_path(client_id)
+        self.path = path
+        self.sent = 0
+        self.deferred = 0
+        # fields that didn't get through yet
+        self.pending = {}
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def publish(self, **fields):
+        # None removes a field from the activity; True if the broker got it, False if it is pending
+        if self.pending:
+            self.pending.update(fields)
+            fields = self.pending
+        return self._send(fields)
+
+    def clear(self):
+        self.pending = {}
+        return self._send({'clear': True})
+
+    def flush(self, timeout=1):
+        # wait up to timeout seconds for the broker to take the pending fields
+        if not self.pending:
+            return True
+        self._socket.settimeout(timeout)
+        try:
+            return self._send(self.pending)
+        finally:
+            self._socket.setblocking(False)
+
+    def _send(self, fields):
+        try:
+            self._socket.sendto(dumps(fields), self.path)
+        except (BlockingIOError, socket.timeout, FileNotFoundError, ConnectionRefusedError):
+            if fields is not self.pending:
+                self.pending = dict(fields)
+            self.deferred += 1
+            return False
+        self.pending = {}
+        self.sent += 1
+        return True
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PresenceBroker:
+
+    def __init__(self, client_id, path=None, interval=15, retry_delay=5, **kwargs):
+        self.path = path or default_path(client_id)
+        self.retry_delay = retry_delay
+        kwargs.setdefault('pipe', None)
+        kwargs.setdefault('reconnect', True)
+        self.presence = AsyncPresence(client_id, coalesce=True, coalesce_window=interval, **kwargs)
+
+        # everything published so far merged into one activity, None when cleared
+        self.activity = None
+        self.received = 0
+        self.merged = 0
+        self.unchanged = 0
+        self.malformed = 0
+        self._flush_handle = None
+        self._transport = None
+        self._connect_task = None
+        self._tasks = set()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # updates are merged and held from the start, before there's a connection to put them on
+        self.presence.loop = loop
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _BrokerProtocol(self), local_addr=self.path, family=socket.AF_UNIX)
+        self._connect_task = loop.create_task(self._connect())
+        return self
+
+    async def _connect(self):
+        # Discord may not be running yet; publishers are heard meanwhile and the result is shown once it is
+        while True:
+            try:
+                await self.presence.connect()
+                break
+            except InvalidID as err:
+                self.presence.loop.call_exception_handler({
+                    'message': 'Discord rejected the broker\'s client ID',
+                    'exception': err,
+                })
+                return
+            except (PyPresenceException, OSError):
+                await asyncio.sleep(self.retry_delay)
+        if self.activity is not None:
+            await self.presence.show(self.activity)
+
+    def _received(self, data):
+        self.received += 1
+        try:
+            fields = loads(data)
+            activity = None if fields.pop('clear', False) else self.activity
+            if fields:
+                activity = (activity if activity is not None else Activity()).replace(**fields)
+        except Exception:
+            self.malformed += 1
+            return
+        if activity is self.activity:
+            self.unchanged += 1
+            return
+        self.activity = activity
+        self.merged += 1
+        # a burst of datagrams read together ends in one hand-over to the presence
+        if self._flush_handle is None:
+            self._flush_handle = self.presence.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        if self.activity is None:
+            self._spawn(self.presence.clear())
+        else:
+            self._spawn(self.presence.show(self.activity))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        # InvalidPipe: not connected yet, the activity is kept for when we are
+        if task.exception() is not None and not isinstance(task.exception(), InvalidPipe):
+            self.presence.loop.call_exception_handler({
+                'message': 'Failed to forward a published activity',
+                'exception': task.exception(),
+            })
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'merged': self.merged,
+            'unchanged': self.unchanged,
+            'malformed': self.malformed,
+            'connected': self.presence.connected,
+        }
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+            await asyncio.gather(self._connect_task, return_exceptions=True)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.presence.loop is not None:
+            await self.presence.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _BrokerProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def datagram_received(self, data, addr):
+        self.broker._received(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pypresence.broker')
+    parser.add_argument('client_id')
+    parser.add_argument('--path', help='socket publishers send to, defaults to pypresence-broker-<client_id> '
+                                       'in the runtime directory')
+    parser.add_argument('--pipe', type=int, default=None, help='Discord pipe, all are tried if left out')
+    parser.add_argument('--interval', type=float, default=15, help='seconds between activity updates')
+    options = parser.parse_args(argv)
+
+    async def run():
+        async with PresenceBroker(options.client_id, options.path, options.interval, pipe=options.pipe) as broker:
+            print('listening on', broker.path, file=sys.stderr)
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
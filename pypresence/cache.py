@@ -0,0 +1,69 @@
+import collections
+import threading
+import time
+
+# commands whose replies can be cached, and what makes them stale
+CACHED_COMMANDS = frozenset((
+    "GET_GUILDS", "GET_GUILD", "GET_CHANNELS", "GET_CHANNEL", "GET_VOICE_SETTINGS", "GET_SELECTED_VOICE_CHANNEL"))
+INVALIDATED_BY = {
+    # events, for clients subscribed to them
+    "GUILD_STATUS": ("GET_GUILDS", "GET_GUILD"),
+    "GUILD_CREATE": ("GET_GUILDS",),
+    "CHANNEL_CREATE": ("GET_CHANNELS",),
+    "VOICE_SETTINGS_UPDATE": ("GET_VOICE_SETTINGS",),
+    "VOICE_CHANNEL_SELECT": ("GET_SELECTED_VOICE_CHANNEL",),
+    # and our own commands
+    "SET_VOICE_SETTINGS": ("GET_VOICE_SETTINGS",),
+    "SELECT_VOICE_CHANNEL": ("GET_SELECTED_VOICE_CHANNEL",),
+}
+
+
+class ResponseCache:
+    # Replies keyed on (cmd, encoded args), dropped after ttl seconds or when more than size are kept,
+    # least recently used first. Sync clients read it from their own thread while the loop writes to it,
+    # hence the lock.
+
+    def __init__(self, ttl=60, size=256):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        # bumped on every invalidation, so a reply that was in flight meanwhile isn't stored
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, commands=None):
+        # drop the entries for these commands, or everything
+        with self._lock:
+            self.generation += 1
+            if commands is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] in commands]:
+                del self._entries[key]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
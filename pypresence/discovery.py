@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+import time
+
+from .exceptions import *
+
+# where sandboxed installs put their sockets, relative to the runtime dir
+SANDBOX_DIRS = ('', 'app/com.discordapp.Discord', 'app/com.discordapp.DiscordCanary', 'snap.discord', 'snap.discord-canary')
+
+_cached_path = None
+
+
+class Discovery:
+    # result of discover(): the winning path, how long discovery took and how long each probe took
+
+    def __init__(self, path, elapsed, timings, cached=False):
+        self.path = path
+        self.elapsed = elapsed
+        self.timings = timings
+        self.cached = cached
+
+    def __repr__(self):
+        return '<Discovery path={!r} elapsed={:.6f} probed={} cached={}>'.format(
+            self.path, self.elapsed, len(self.timings), self.cached)
+
+
+def candidate_paths():
+    if sys.platform == 'win32':
+        return [r'\\?\pipe\discord-ipc-' + str(pipe) for pipe in range(10)]
+    bases = []
+    for base in (os.environ.get('XDG_RUNTIME_DIR'), os.environ.get('TMPDIR'), os.environ.get('TMP'),
+                 os.environ.get('TEMP'), '/tmp'):
+        if base and base not in bases:
+            bases.append(base)
+    return [os.path.join(base, sandbox, 'discord-ipc-' + str(pipe))
+            for base in bases for sandbox in SANDBOX_DIRS for pipe in range(10)]
+
+
+async def _probe(loop, path):
+    start = time.perf_counter()
+    if sys.platform == 'win32':
+        transport, _ = await loop.create_pipe_connection(asyncio.Protocol, path)
+    else:
+        transport, _ = await loop.create_unix_connection(asyncio.Protocol, path)
+    transport.close()
+    return path, time.perf_counter() - start
+
+
+async def discover(timeout=5, use_cache=True):
+    # Connect to every candidate socket at once and return the first that accepts.
+    # The probe connection is closed again, the client does its handshake on a fresh one.
+    global _cached_path
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    if use_cache and _cached_path is not None:
+        return Discovery(_cached_path, time.perf_counter() - start, {}, cached=True)
+
+    paths = candidate_paths()
+    if sys.platform != 'win32':
+        paths = [path for path in paths if os.path.exists(path)]
+    timings = dict.fromkeys(paths)
+    tasks = [loop.create_task(_probe(loop, path)) for path in paths]
+    winner = None
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            try:
+                path, elapsed = await next_done
+            except OSError:
+                continue
+            timings[path] = elapsed
+            winner = path
+            break
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if winner is None:
+        raise InvalidPipe
+    _cached_path = winner
+    return Discovery(winner, time.perf_counter() - start, timings)
+
+
+async def discover_all(timeout=5):
+    # Every candidate socket that accepts a connection, e.g. to find all running Discord instances.
+    loop = asyncio.get_running_loop()
+    paths = candidate_paths()
+    if sys.platform != 'win32':
+        paths = [path for path in paths if os.path.exists(path)]
+    tasks = [loop.create_task(_probe(loop, path)) for path in paths]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return [path for path, task in zip(paths, tasks) if task in done and task.exception() is None]
+
+
+def forget():
+    global _cached_path
+    _cached_path = None
@@ -0,0 +1,166 @@
+import asyncio
+import collections
+import collections.abc
+import inspect
+import time
+
+from .exceptions import *
+from .payloads import loads
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class LazyData(collections.abc.Mapping):
+    # an event's data that is only parsed once a handler looks at it, see lazy_events in baseclient.py
+    __slots__ = ('_raw', '_data')
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._data = None
+
+    def materialize(self):
+        if self._data is None:
+            self._data = loads(self._raw)["data"]
+            self._raw = None
+        return self._data
+
+    def __getitem__(self, key):
+        return self.materialize()[key]
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __repr__(self):
+        return 'LazyData({!r})'.format(self.materialize())
+
+
+class EventDispatcher:
+    # Runs event handlers for a client.
+    #
+    # With workers=0 sync handlers are called inline as frames arrive and coroutine handlers each get a task.
+    # With workers=N every event goes into a bounded queue per event name and N worker tasks run the
+    # handlers, so the protocol keeps reading the pipe while handlers work. When a queue is full the
+    # overflow policy decides: 'block' pauses reading from the pipe until the queue drains to half,
+    # 'drop_oldest' and 'drop_newest' throw an event away.
+
+    def __init__(self, client, workers=0, queue_size=256, overflow='block', executor=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise PyPresenceException('overflow must be one of {}'.format(', '.join(OVERFLOW_POLICIES)))
+        self.client = client
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.executor = executor
+        self.dropped = 0
+
+        self._queues = {}
+        self._ready = collections.deque()
+        self._wakeup = None
+        self._tasks = set()
+        self._blocked = set()
+
+    def dispatch(self, event, handler, data):
+        if not self.workers:
+            if inspect.iscoroutinefunction(handler) or self.executor is not None:
+                self._spawn(self._call(event, handler, data))
+            else:
+                self._call_inline(event, handler, data)
+            return
+
+        queue = self._queues.get(event)
+        if queue is None:
+            queue = self._queues[event] = collections.deque()
+        if len(queue) >= self.queue_size:
+            if self.overflow == 'drop_newest':
+                self.dropped += 1
+                return
+            if self.overflow == 'drop_oldest':
+                queue.popleft()
+                self.dropped += 1
+            elif event not in self._blocked:
+                # can't block inside data_received, so stop reading until the workers catch up
+                self._blocked.add(event)
+                if len(self._blocked) == 1:
+                    self.client._pause_reading()
+        if not queue:
+            self._ready.append(event)
+        queue.append((handler, data))
+
+        if len(self._tasks) < self.workers:
+            self._spawn(self._worker())
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _spawn(self, coro):
+        task = self.client.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _worker(self):
+        loop = self.client.loop
+        while True:
+            if not self._ready:
+                if self._wakeup is None or self._wakeup.done():
+                    self._wakeup = loop.create_future()
+                await self._wakeup
+                continue
+
+            # round robin over event names so one busy event can't starve the others
+            event = self._ready.popleft()
+            queue = self._queues[event]
+            handler, data = queue.popleft()
+            if queue:
+                self._ready.append(event)
+            if event in self._blocked and len(queue) <= self.queue_size // 2:
+                self._blocked.discard(event)
+                if not self._blocked:
+                    self.client._resume_reading()
+
+            await self._call(event, handler, data)
+
+    async def _call(self, event, handler, data):
+        start = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(handler):
+                await handler(data)
+            elif self.executor is not None:
+                executor = None if self.executor is True else self.executor
+                await self.client.loop.run_in_executor(executor, handler, data)
+            else:
+                handler(data)
+        except Exception as err:
+            self._report(err)
+        self._timed(event, start)
+
+    def _call_inline(self, event, handler, data):
+        start = time.perf_counter()
+        try:
+            handler(data)
+        except Exception as err:
+            self._report(err)
+        self._timed(event, start)
+
+    def _timed(self, event, start):
+        if self.client.metrics is not None:
+            self.client.metrics.handler(event, time.perf_counter() - start)
+
+    def _report(self, err):
+        self.client._exception({
+            'message': 'Exception in event handler',
+            'exception': err,
+        })
+
+    def queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queues.clear()
+        self._ready.clear()
+        self._blocked.clear()
@@ -32,3 +32,13 @@ class ArgumentError(PyPresenceException):
 class EventNotFound(PyPresenceException):
     def __init__(self, event):
         super().__init__('No event with name {0} exists.'.format(event))
+
+
+class WriteBufferFull(PyPresenceException):
+    def __init__(self):
+        super().__init__('Discord is not reading, the outbound buffer is full.')
+
+
+class ConnectionTimeout(PyPresenceException):
+    def __init__(self):
+        super().__init__('Discord did not answer in time.')
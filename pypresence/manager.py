@@ -0,0 +1,179 @@
+import asyncio
+import sys
+import threading
+
+from .client import AsyncClient, Client
+from .discovery import discover_all
+from .dispatch import EventDispatcher
+from .exceptions import *
+from .metrics import ClientMetrics
+from .presence import AsyncPresence, Presence
+
+# Many connections on one loop: several client IDs, several Discord instances, one I/O thread.
+#
+#     with ConnectionManager() as manager:
+#         for path in manager.discover():
+#             manager.presence(client_id, path=path).update(state='Hosting')
+#         ...
+#
+# Every connection costs a socket. The loop, the I/O thread and the event handler pool are shared,
+# and closing one connection leaves the others running.
+
+
+class ConnectionManager:
+
+    def __init__(self, loop=None, isasync=False, event_workers=0, event_queue_size=256, event_overflow='block',
+                 handler_executor=None):
+        self.isasync = isasync
+        self.clients = []
+        self.paths = None
+        # the clients paused for a full dispatcher queue, None while it isn't full
+        self._paused = None
+
+        self._owns_loop = False
+        if loop is not None:
+            self.loop = loop
+        elif isasync:
+            # async managers are made inside the loop they run on
+            self.loop = asyncio.get_running_loop()
+        elif sys.platform == 'win32':
+            self.loop = asyncio.ProactorEventLoop()
+            self._owns_loop = True
+        else:
+            self.loop = asyncio.new_event_loop()
+            self._owns_loop = True
+
+        # handler timings across every connection, the clients' own metrics cover their commands
+        self.metrics = ClientMetrics(report=self._exception)
+        self.dispatcher = EventDispatcher(self, event_workers, event_queue_size, event_overflow, handler_executor)
+
+        self._thread = None
+        if not isasync:
+            self._thread = threading.Thread(target=self.loop.run_forever, name='pypresence-manager', daemon=True)
+            self._thread.start()
+
+    def _run(self, coro):
+        if self.isasync:
+            return coro
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise PyPresenceException('Blocking calls can\'t be made from the I/O thread, e.g. in an event handler.')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # the shared dispatcher talks to the manager as if it were a client: a full queue pauses every connection
+    def _pause_reading(self):
+        self._paused = list(self.clients)
+        for client in self._paused:
+            client._pause_reading()
+
+    def _resume_reading(self):
+        paused, self._paused = self._paused or [], None
+        for client in paused:
+            client._resume_reading()
+
+    def _exception(self, context):
+        self.loop.call_exception_handler(context)
+
+    def discover(self, timeout=5):
+        # probe every candidate pipe once and keep the ones that answered for later connections
+        return self._run(self._discover(timeout))
+
+    async def _discover(self, timeout):
+        self.paths = await discover_all(timeout)
+        return self.paths
+
+    def add(self, cls, client_id, pipe=0, path=None, **kwargs):
+        # a client of class cls on the manager's loop; path is one from discover() and overrides pipe
+        if path is not None:
+            pipe = None
+        if self.isasync:
+            client = cls(client_id, pipe=pipe, loop=self.loop, dispatcher=self.dispatcher, **kwargs)
+        else:
+            client = cls(client_id, pipe=pipe, loop=self.loop, io_thread=self._thread, dispatcher=self.dispatcher,
+                         **kwargs)
+        if path is not None:
+            client.ipc_path = path
+            client.pipe = int(path.rsplit('-', 1)[1])
+        self.clients.append(client)
+        if self.isasync:
+            self._join_pause(client)
+        else:
+            self.loop.call_soon_threadsafe(self._join_pause, client)
+        return client
+
+    def _join_pause(self, client):
+        # a client added while the dispatcher is full waits for it with the others
+        if self._paused is not None and client in self.clients:
+            self._paused.append(client)
+            client._pause_reading()
+
+    def presence(self, client_id, pipe=0, path=None, **kwargs):
+        return self.add(AsyncPresence if self.isasync else Presence, client_id, pipe, path, **kwargs)
+
+    def client(self, client_id, pipe=0, path=None, **kwargs):
+        return self.add(AsyncClient if self.isasync else Client, client_id, pipe, path, **kwargs)
+
+    def connect_all(self):
+        # handshake every connection that isn't up yet, all at once; a list of READY responses or exceptions
+        return self._run(self._connect_all())
+
+    async def _connect_all(self):
+        clients = [client for client in self.clients if not client.connected]
+        return await asyncio.gather(*[client.handshake() for client in clients], return_exceptions=True)
+
+    def remove(self, client):
+        # close one connection, the loop and the rest keep going
+        self.clients.remove(client)
+        return self._run(self._remove(client))
+
+    async def _remove(self, client):
+        if self._paused is not None and client in self._paused:
+            self._paused.remove(client)
+            client._resume_reading()
+        await client._close()
+
+    def health(self):
+        return self._run(self._health())
+
+    async def _health(self):
+        return [{
+            'client_id': client.client_id,
+            'path': client.ipc_path,
+            'connected': client.connected,
+            'reconnecting': client._reconnect_task is not None,
+            'reconnects': client.reconnects,
+            'last_recovery_time': client.last_recovery_time,
+            'pending': len(client._pending),
+            'rtt': client.smoothed_rtt,
+            'outbound_buffer': client.sock_writer.get_write_buffer_size()
+            if client.sock_writer is not None and not client.sock_writer.is_closing() else 0,
+        } for client in self.clients]
+
+    def close(self):
+        if self.isasync:
+            return self._close()
+        try:
+            self._run(self._close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+        if self._owns_loop:
+            self.loop.close()
+
+    async def _close(self):
+        clients, self.clients = self.clients, []
+        await asyncio.gather(*[client._close() for client in clients], return_exceptions=True)
+        await self.dispatcher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,103 @@
+import collections
+
+
+class Histogram:
+    # Durations in power-of-two microsecond buckets: recording is a bit_length() and an increment,
+    # percentiles are accurate to within a factor of two, which is plenty to tell 50us from 50ms.
+
+    def __init__(self):
+        self.buckets = [0] * 48
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[min(int(seconds * 1e6).bit_length(), 47)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted:
+                # upper edge of the bucket, but never above what was actually seen
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max if self.count else None,
+        }
+
+
+class ClientMetrics:
+    # Counters and histograms for one client. observer, if set, is called as observer(kind, name, value) for
+    # every command round trip ('command', cmd, seconds), handler run ('handler', evt, seconds) and
+    # reconnect ('reconnect', None, recovery seconds); frame and byte counters are only in snapshot().
+    # An observer that raises is reported to report(context), as loop.call_exception_handler would be, and
+    # never to whatever was being measured.
+
+    def __init__(self, observer=None, report=None):
+        self.observer = observer
+        self.report = report
+        self.command_latency = collections.defaultdict(Histogram)
+        self.command_errors = collections.Counter()
+        self.frames_sent = collections.Counter()
+        self.bytes_sent = collections.Counter()
+        self.frames_received = collections.Counter()
+        self.bytes_received = collections.Counter()
+        self.events = collections.Counter()
+        # events dropped unparsed because nothing handles them
+        self.skipped = collections.Counter()
+        self.handler_time = collections.defaultdict(Histogram)
+
+    def command(self, cmd, seconds, ok=True):
+        self.command_latency[cmd].record(seconds)
+        if not ok:
+            self.command_errors[cmd] += 1
+        if self.observer is not None:
+            self._observe('command', cmd, seconds)
+
+    def handler(self, evt, seconds):
+        self.handler_time[evt].record(seconds)
+        if self.observer is not None:
+            self._observe('handler', evt, seconds)
+
+    def reconnect(self, seconds):
+        if self.observer is not None:
+            self._observe('reconnect', None, seconds)
+
+    def _observe(self, kind, name, seconds):
+        try:
+            self.observer(kind, name, seconds)
+        except Exception as err:
+            if self.report is not None:
+                self.report({
+                    'message': 'Exception in metrics observer',
+                    'exception': err,
+                })
+
+    def snapshot(self):
+        return {
+            'commands': {cmd: dict(histogram.snapshot(), errors=self.command_errors[cmd])
+                         for cmd, histogram in self.command_latency.items()},
+            'frames_sent': dict(self.frames_sent),
+            'bytes_sent': dict(self.bytes_sent),
+            'frames_received': dict(self.frames_received),
+            'bytes_received': dict(self.bytes_received),
+            'events': {evt: {'count': self.events[evt], 'handler': self.handler_time[evt].snapshot()
+                             if evt in self.handler_time else None}
+                       for evt in dict.fromkeys(list(self.events) + list(self.handler_time))},
+            'skipped_events': dict(self.skipped),
+        }
@@ -0,0 +1,277 @@
+import inspect
+import json
+import os
+import struct
+
+# Fastest JSON library available wins, the rest of pypresence only uses dumps/loads from here.
+# dumps always returns utf-8 bytes, loads accepts any bytes-like object including memoryviews.
+try:
+    import orjson
+
+    json_backend = 'orjson'
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        json_backend = 'msgspec'
+        dumps = msgspec.json.Encoder().encode
+        loads = msgspec.json.Decoder().decode
+    except ImportError:
+        json_backend = 'json'
+        _encode = json.JSONEncoder(separators=(',', ':')).encode
+
+        def dumps(obj):
+            return _encode(obj).encode('utf-8')
+
+        def loads(data):
+            return json.loads(bytes(data))
+
+
+header = struct.Struct('<II')
+
+_prefixes = {}
+
+
+def encode_args(args):
+    # args are a dict, or an Activity that keeps its own encoding
+    if type(args) is dict:
+        return dumps(args)
+    return args.encode()
+
+
+def encode_frame(cmd: str, args, nonce: str, evt: str = None, op: int = 1):
+    # payloads are always {"cmd":..,"args":..,"nonce":..[,"evt":..]}, only args needs real encoding
+    prefix = _prefixes.get(cmd)
+    if prefix is None:
+        prefix = _prefixes[cmd] = b'{"cmd":' + dumps(cmd) + b',"args":'
+    body = prefix + encode_args(args) + b',"nonce":"' + nonce.encode('ascii') + b'"'
+    if evt is not None:
+        body += b',"evt":' + dumps(evt)
+    body += b'}'
+    return header.pack(op, len(body)) + body
+
+
+# one method parameter and where it goes in the command's args
+class Arg:
+
+    def __init__(self, name, path=None, default=inspect.Parameter.empty, convert=None, keep_none=False):
+        self.name = name
+        self.path = tuple((path or name).split('.'))
+        self.default = default
+        self.convert = convert
+        self.keep_none = keep_none
+
+
+# a row of the command table: the RPC command and how to build its args from method parameters
+class Command:
+
+    def __init__(self, cmd, *fields, static=None):
+        self.cmd = cmd
+        self.fields = fields
+        self.static = static
+        self.names = tuple(field.name for field in fields)
+        self.defaults = {field.name: field.default for field in fields
+                         if field.default is not inspect.Parameter.empty}
+
+    def bind(self, method_name, args, kwargs):
+        if len(args) > len(self.names):
+            raise TypeError('{}() takes {} positional arguments but {} were given'
+                            .format(method_name, len(self.names), len(args)))
+        values = dict(self.defaults)
+        values.update(zip(self.names, args))
+        for name in kwargs:
+            if name not in self.names:
+                raise TypeError("{}() got an unexpected keyword argument '{}'".format(method_name, name))
+        values.update(kwargs)
+        if len(values) != len(self.names):
+            missing = [name for name in self.names if name not in values]
+            raise TypeError('{}() missing required arguments: {}'.format(method_name, ', '.join(missing)))
+        return values
+
+    def build_args(self, values):
+        # None fields are simply never inserted, so there's nothing to strip afterwards
+        args = {} if self.static is None else dict(self.static)
+        for field in self.fields:
+            value = values[field.name]
+            if value is None:
+                if not field.keep_none:
+                    continue
+            elif field.convert is not None:
+                value = field.convert(value)
+            target = args
+            for key in field.path[:-1]:
+                parent, target = target, target.get(key)
+                if target is None:
+                    target = parent[key] = {}
+            target[field.path[-1]] = value
+        return args
+
+    def method(self, name):
+        command = self
+
+        def method(self, *args, **kwargs):
+            return self._command(command, command.build_args(command.bind(name, args, kwargs)))
+
+        method.__name__ = name
+        method.__signature__ = inspect.Signature(
+            [inspect.Parameter('self', inspect.Parameter.POSITIONAL_OR_KEYWORD)] +
+            [inspect.Parameter(field.name, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=field.default)
+             for field in self.fields])
+        return method
+
+
+_activity_fields = (
+    Arg('pid', default=os.getpid()),
+    Arg('state', 'activity.state', None),
+    Arg('details', 'activity.details', None),
+    Arg('start', 'activity.timestamps.start', None),
+    Arg('end', 'activity.timestamps.end', None),
+    Arg('large_image', 'activity.assets.large_image', None),
+    Arg('large_text', 'activity.assets.large_text', None),
+    Arg('small_image', 'activity.assets.small_image', None),
+    Arg('small_text', 'activity.assets.small_text', None),
+    Arg('party_id', 'activity.party.id', None),
+    Arg('party_size', 'activity.party.size', None),
+    Arg('join', 'activity.secrets.join', None),
+    Arg('spectate', 'activity.secrets.spectate', None),
+    Arg('match', 'activity.secrets.match', None),
+    Arg('instance', 'activity.instance', True),
+)
+
+SET_ACTIVITY = Command('SET_ACTIVITY', *_activity_fields)
+
+
+_activity_by_name = {field.name: field for field in _activity_fields}
+_activity_index = {name: index for index, name in enumerate(SET_ACTIVITY.names)}
+
+
+class Activity:
+    # The args of one SET_ACTIVITY as a value: built once, encoded once, and never changed afterwards.
+    # replace() makes a new one that shares whatever didn't change, or hands back the same object if nothing did.
+    __slots__ = ('_values', '_args', '_encoded')
+
+    def __init__(self, *args, **kwargs):
+        values = SET_ACTIVITY.bind('Activity', args, kwargs)
+        self._values = tuple(values[name] for name in SET_ACTIVITY.names)
+        self._args = None
+        self._encoded = None
+
+    def replace(self, **changes):
+        changed = {}
+        for name, value in changes.items():
+            index = _activity_index.get(name)
+            if index is None:
+                raise TypeError("replace() got an unexpected keyword argument '{}'".format(name))
+            if self._values[index] != value:
+                changed[name] = value
+        if not changed:
+            return self
+        values = list(self._values)
+        for name, value in changed.items():
+            values[_activity_index[name]] = value
+        activity = object.__new__(Activity)
+        activity._values = tuple(values)
+        activity._args = None if self._args is None else _patch_args(self._args, changed)
+        activity._encoded = None
+        return activity
+
+    def to_dict(self):
+        # shared with every later caller, don't modify it
+        if self._args is None:
+            self._args = SET_ACTIVITY.build_args(dict(zip(SET_ACTIVITY.names, self._values)))
+        return self._args
+
+    def encode(self):
+        if self._encoded is None:
+            self._encoded = dumps(self.to_dict())
+        return self._encoded
+
+    def __eq__(self, other):
+        if not isinstance(other, Activity):
+            return NotImplemented
+        return self._values == other._values
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Activity({})'.format(', '.join('{}={!r}'.format(name, value)
+                                               for name, value in zip(SET_ACTIVITY.names, self._values)
+                                               if value is not None))
+
+
+# read-only attributes, activity.state and so on
+for _index, _name in enumerate(SET_ACTIVITY.names):
+    setattr(Activity, _name, property(lambda self, _index=_index: self._values[_index]))
+
+
+def _patch_args(args, changes):
+    # a copy of args with the changed fields set or removed, copying only the dicts on their paths
+    args = dict(args)
+    copied = set()
+    for name, value in changes.items():
+        field = _activity_by_name[name]
+        path = field.path
+        parents = []
+        target = args
+        for depth, key in enumerate(path[:-1]):
+            child = target.get(key)
+            if child is None:
+                child = target[key] = {}
+            elif path[:depth + 1] not in copied:
+                child = target[key] = dict(child)
+            copied.add(path[:depth + 1])
+            parents.append((target, key))
+            target = child
+        if value is None and not field.keep_none:
+            target.pop(path[-1], None)
+            # build_args never makes empty dicts, so don't leave any behind either
+            for parent, key in reversed(parents):
+                if parent[key]:
+                    break
+                del parent[key]
+        else:
+            target[path[-1]] = value if field.convert is None else field.convert(value)
+    return args
+
+
+CLEAR_ACTIVITY = Command('SET_ACTIVITY', Arg('pid', default=os.getpid()), static={'activity': None})
+
+# method name -> command, Client gets one method per row
+CLIENT_COMMANDS = {
+    'authorize': Command('AUTHORIZE', Arg('client_id', convert=str), Arg('scopes')),
+    'authenticate': Command('AUTHENTICATE', Arg('token', 'access_token')),
+    'get_guilds': Command('GET_GUILDS'),
+    'get_guild': Command('GET_GUILD', Arg('guild_id', convert=str)),
+    'get_channel': Command('GET_CHANNEL', Arg('channel_id', convert=str)),
+    'get_channels': Command('GET_CHANNELS', Arg('guild_id', convert=str)),
+    'set_user_voice_settings': Command(
+        'SET_USER_VOICE_SETTINGS',
+        Arg('user_id', convert=str),
+        Arg('pan_left', 'pan.left', None),
+        Arg('pan_right', 'pan.right', None),
+        Arg('volume', default=None),
+        Arg('mute', default=None)),
+    'select_voice_channel': Command('SELECT_VOICE_CHANNEL', Arg('channel_id', convert=str, keep_none=True)),
+    'get_selected_voice_channel': Command('GET_SELECTED_VOICE_CHANNEL'),
+    'select_text_channel': Command('SELECT_TEXT_CHANNEL', Arg('channel_id', convert=str, keep_none=True)),
+    'set_activity': SET_ACTIVITY,
+    'clear_activity': CLEAR_ACTIVITY,
+    'get_voice_settings': Command('GET_VOICE_SETTINGS'),
+    'set_voice_settings': Command(
+        'SET_VOICE_SETTINGS',
+        Arg('_input', 'input', None),
+        Arg('output', default=None),
+        Arg('mode', default=None),
+        Arg('automatic_gain_control', default=None),
+        Arg('echo_cancellation', default=None),
+        Arg('noise_suppression', default=None),
+        Arg('qos', default=None),
+        Arg('silence_warning', default=None),
+        Arg('deaf', default=None),
+        Arg('mute', default=None)),
+    'capture_shortcut': Command('CAPTURE_SHORTCUT', Arg('action', convert=str.upper)),
+    'send_activity_join_invite': Command('SEND_ACTIVITY_JOIN_INVITE', Arg('user_id', convert=str)),
+    'close_activity_request': Command('CLOSE_ACTIVITY_REQUEST', Arg('user_id', convert=str)),
+}
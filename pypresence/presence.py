@@ -1,81 +1,226 @@
-import os
-import time
+import collections.abc
+import functools
+import itertools
+import threading
 
 from .utils import *
 from .baseclient import BaseClient
+from .exceptions import *
+from .payloads import CLEAR_ACTIVITY, SET_ACTIVITY, Activity, encode_args
+
+
+# Discord drops activity updates sent more often than this, rotate() never goes faster
+MIN_ROTATE_INTERVAL = 15
 
 
 class Presence(BaseClient):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, coalesce=False, coalesce_window=15, **kwargs):
 
         super().__init__(*args, **kwargs)
+        if coalesce and self.transport is not None:
+            raise PyPresenceException('Coalescing needs an event loop, not a blocking transport.')
+
+        # latest-wins state for coalesced updates, see _coalesce_update
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self._latest_activity = None
+        self._latest_key = None
+        self._in_flight_key = None
+        self._acked_key = None
+        self._last_flush = None
+        self._flush_handle = None
+        # the last activity passed to update() or patch(), what patch() builds on
+        self.activity = None
+        # rotate() state: where the next activity comes from and the timer for it
+        self._rotation = None
+        self._rotation_handle = None
+
+    def update(self, *args, **kwargs):
+        return self.show(Activity(*args, **kwargs))
+
+    update.__signature__ = SET_ACTIVITY.method('update').__signature__
+
+    def show(self, activity):
+        self.activity = activity
+        return self._command(SET_ACTIVITY, activity)
+
+    def patch(self, **changes):
+        # only the fields that change; nothing is sent if none of them actually do
+        return self._run(self._patch(changes))
 
-    def update(self,pid=os.getpid(),state=None,details=None,start=None,end=None,large_image=None,large_text=None,small_image=None,small_text=None,party_id=None,party_size=None,join=None,spectate=None,match=None,instance=True):
-
-        was_listening=self.listening
-        waiter=self.sock_reader._waiter
-        self.sock_reader._waiter=None
-        #HACK
-        #not thread safe in the least
-        #if we are listening for events in the background
-            
-        current_time = time.time()
-        payload = {
-            "cmd": "SET_ACTIVITY",
-            "args": {
-                "pid": pid,
-                "activity": {
-                    "state": state,
-                    "details": details,
-                    "timestamps": {
-                        "start": start,
-                        "end": end
-                    },
-                    "assets": {
-                        "large_image": large_image,
-                        "large_text": large_text,
-                        "small_image": small_image,
-                        "small_text": small_text
-                    },
-                    "party": {
-                        "id": party_id,
-                        "size": party_size
-                    },
-                    "secrets": {
-                        "join": join,
-                        "spectate": spectate,
-                        "match": match
-                    },
-                    "instance": instance,
-                },
-            },
-            "nonce": '{:.20f}'.format(current_time)
-        }
-        payload = remove_none(payload)
+    async def _patch(self, changes):
+        # on the loop, so patches from several threads each build on the one before
+        base = self.activity if self.activity is not None else Activity()
+        activity = base.replace(**changes)
+        if activity is self.activity:
+            return None
+        self.activity = activity
+        if self.coalesce:
+            return await self._coalesce_update(activity)
+        return await self.request(SET_ACTIVITY.cmd, activity)
+
+    clear = CLEAR_ACTIVITY.method('clear')
+
+    def rotate(self, activities, interval=MIN_ROTATE_INTERVAL):
+        # Show activities one after another from a timer on the loop, so the caller doesn't have to keep
+        # calling update(). A sequence repeats, an iterator runs until it's exhausted, and a callable is
+        # asked for the next one every time. Each can be an Activity, a dict of update() options, or None.
+        if self.transport is not None:
+            raise PyPresenceException('rotate() needs an event loop, not a blocking transport.')
+        interval = max(interval, MIN_ROTATE_INTERVAL)
+        if callable(activities):
+            source = activities
+        else:
+            if not isinstance(activities, collections.abc.Iterator):
+                activities = itertools.cycle(list(activities))
+            source = functools.partial(next, activities)
+        if not self.isasync and self._thread is None:
+            # a sync client's loop only runs during calls, the timer needs it running all the time
+            self._start_thread()
+        self._on_loop(self._start_rotation, source, interval)
+
+    def stop_rotation(self):
+        self._on_loop(self._stop_rotation)
+
+    def _on_loop(self, callback, *args):
+        if self.isasync or threading.current_thread() is self._thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _start_rotation(self, source, interval):
+        self._stop_rotation()
+        self._rotation = (source, interval)
+        self._rotate()
+
+    def _stop_rotation(self):
+        self._rotation = None
+        if self._rotation_handle is not None:
+            self._rotation_handle.cancel()
+            self._rotation_handle = None
+
+    def _rotate(self):
+        source, interval = self._rotation
+        self._rotation_handle = self.loop.call_later(interval, self._rotate)
         try:
-            self.send_data(1, payload)
-            response = self.loop.run_until_complete(self.read_output())
-        finally:
-            #NOT THREAD SAFE AND THAT'S AN UNDERSTATEMENT
-            
-            self.listening=was_listening
-            self.sock_reader._waiter=waiter
-        return response
-
-    def clear(self,pid=os.getpid()):
-        current_time = time.time()
-        payload = {
-            "cmd": "SET_ACTIVITY",
-            "args": {
-                "pid": pid,
-                "activity": None
-            },
-            "nonce": '{:.20f}'.format(current_time)
-        }
-        self.send_data(1, payload)
-        return self.loop.run_until_complete(self.read_output())
-    
-    def connect(self):
-        return self.loop.run_until_complete(self.handshake())
+            activity = source()
+        except StopIteration:
+            self._stop_rotation()
+            return
+        except Exception as err:
+            self.loop.call_exception_handler({
+                'message': 'Exception while getting the next activity to rotate to',
+                'exception': err,
+            })
+            return
+        if activity is None:
+            return
+        if not isinstance(activity, Activity):
+            activity = Activity(**activity)
+        if activity == self.activity:
+            return
+        self.activity = activity
+        if not self.connected and self._connecting is None:
+            # shown once a reconnect replays the session
+            self._last_activity = activity
+            return
+        if self.coalesce:
+            task = self.loop.create_task(self._coalesce_update(activity))
+        else:
+            task = self.loop.create_task(self.request(SET_ACTIVITY.cmd, activity))
+        task.add_done_callback(self._rotated)
+
+    def _rotated(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.loop.call_exception_handler({
+                'message': 'Failed to rotate the activity',
+                'exception': task.exception(),
+            })
 
+    def _command(self, command, args):
+        if command is CLEAR_ACTIVITY:
+            return self._run(self._clear(args))
+        if self.coalesce:
+            return self._run(self._coalesce_update(args))
+        return super()._command(command, args)
+
+    async def _clear(self, args):
+        self.activity = None
+        self._drop_pending_activity()
+        self._acked_key = None
+        return await self.request(CLEAR_ACTIVITY.cmd, args)
+
+    async def _coalesce_update(self, args):
+        # never waits on the pipe: keep the newest activity and send it once the window allows
+        key = encode_args(args)
+        # an activity Discord already has is only a duplicate if nothing newer is on its way to replace it
+        if key == self._in_flight_key or (key == self._acked_key and self._in_flight_key is None):
+            self._drop_pending_activity()
+            return
+        self._latest_activity = args
+        self._latest_key = key
+
+        now = self.loop.time()
+        if self._last_flush is None or now >= self._last_flush + self.coalesce_window:
+            self._flush_activity()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(
+                self._last_flush + self.coalesce_window - now, self._flush_activity)
+
+    def _flush_activity(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.connected:
+            # kept for _replay once the connection is back
+            return
+        args, key = self._latest_activity, self._latest_key
+        self._latest_activity = self._latest_key = None
+        if args is None:
+            return
+        self._last_flush = self.loop.time()
+        self._in_flight_key = key
+        task = self.loop.create_task(self.request("SET_ACTIVITY", args))
+        task.add_done_callback(lambda task: self._activity_acked(key, task))
+
+    def _activity_acked(self, key, task):
+        if self._in_flight_key == key:
+            self._in_flight_key = None
+        if not task.cancelled() and task.exception() is None:
+            self._acked_key = key
+
+    def _drop_pending_activity(self):
+        self._latest_activity = self._latest_key = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    async def _replay(self):
+        # a coalesced update held back while disconnected replaces the last activity Discord saw
+        if self._latest_activity is not None:
+            self._last_activity = self._latest_activity
+            self._acked_key = self._latest_key
+            self._in_flight_key = None
+            self._drop_pending_activity()
+        await super()._replay()
+
+    def connect(self, block=True):
+        return self._connect(block)
+
+    def _ready(self):
+        # coalesced updates made while connecting were held back until now
+        if self._latest_activity is not None:
+            self._flush_activity()
+
+    async def _close(self):
+        self._stop_rotation()
+        self._drop_pending_activity()
+        await super()._close()
+
+
+class AsyncPresence(Presence):
+
+    def __init__(self, *args, **kwargs):
+        kwargs['isasync'] = True
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,88 @@
+import asyncio
+import re
+
+from .payloads import header
+
+# see https://github.com/discordapp/discord-rpc/blob/master/documentation/hard-mode.md
+OP_HANDSHAKE = 0
+OP_FRAME = 1
+OP_CLOSE = 2
+OP_PING = 3
+OP_PONG = 4
+
+# frame directions, as used by the flight recorder
+SENT = 0
+RECEIVED = 1
+
+
+# Discord sends {"cmd":"DISPATCH","data":{..},"evt":..,"nonce":null}, so a DISPATCH is recognised from the first
+# key and its evt from the last two, without reading the data in between. Frames laid out differently fall back
+# to a scan for evt, which only counts if it appears exactly once: another one could be nested in the data.
+_dispatch_start = re.compile(rb'\s*\{\s*"cmd"\s*:\s*"DISPATCH"')
+_dispatch_end = re.compile(rb'"evt"\s*:\s*"([A-Za-z0-9_]+)"\s*,\s*"nonce"\s*:\s*null\s*\}\s*$')
+_evt = re.compile(rb'"evt"\s*:\s*"([A-Za-z0-9_]+)"')
+_evt_names = {}
+
+
+def peek_dispatch(payload):
+    # the evt of a DISPATCH frame without parsing it, or None if it isn't one or we can't tell cheaply
+    if _dispatch_start.match(payload) is None:
+        return None
+    match = _dispatch_end.search(payload, max(0, len(payload) - 96))
+    if match is None:
+        match = _evt.search(payload)
+        if match is None or _evt.search(payload, match.end()) is not None:
+            return None
+    name = match.group(1)
+    evt = _evt_names.get(name)
+    if evt is None:
+        evt = _evt_names[name] = name.decode('ascii')
+    return evt
+
+
+class IPCProtocol(asyncio.Protocol):
+    # Splits the byte stream into <II header + payload frames and hands each payload to
+    # client._on_frame(op, payload) as a memoryview, valid only for the duration of the call.
+
+    def __init__(self, client):
+        self.client = client
+        self.transport = None
+        self._buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if self._buffer:
+            self._buffer += data
+            consumed = self._split(self._buffer)
+            del self._buffer[:consumed]
+        else:
+            # common case: whole frames in one read, parse straight out of data without copying it
+            consumed = self._split(data)
+            if consumed < len(data):
+                self._buffer += memoryview(data)[consumed:]
+
+    def _split(self, data):
+        offset = 0
+        end = len(data)
+        with memoryview(data) as view:
+            while end - offset >= 8:
+                op, length = header.unpack_from(data, offset)
+                start = offset + 8
+                if end - start < length:
+                    break
+                offset = start + length
+                with view[start:offset] as payload:
+                    self.client._on_frame(op, payload)
+        return offset
+
+    def pause_writing(self):
+        self.client._pause_writing()
+
+    def resume_writing(self):
+        self.client._resume_writing()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.client._connection_lost(exc)
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import collections
+import os
+import struct
+import time
+
+from .payloads import header
+from .protocol import RECEIVED, SENT
+
+# A ring buffer of the last frames that crossed the pipe, and tools to look at or replay a dump of it.
+#
+#     recorder = FlightRecorder(size=4096, payloads=True)
+#     rpc = Client(client_id, recorder=recorder)
+#     ...
+#     recorder.dump('frames.rec')
+#
+#     python -m pypresence.recorder info frames.rec
+#     python -m pypresence.recorder replay frames.rec --profile
+#     python -m pypresence.recorder serve frames.rec --dir /tmp/fake-discord
+
+MAGIC = b'PYPRREC1'
+# direction, opcode, frame length, monotonic timestamp in ns, number of payload bytes stored
+record_header = struct.Struct('<BBIqI')
+
+
+class FlightRecorder:
+
+    def __init__(self, size=1024, payloads=False):
+        self.payloads = payloads
+        self.frames = collections.deque(maxlen=size)
+
+    def record(self, direction, op, payload):
+        self.frames.append((direction, op, len(payload), time.monotonic_ns(),
+                            bytes(payload) if self.payloads else None))
+
+    def record_frame(self, direction, frame):
+        # a whole frame, header included, as it is written to the pipe
+        op, length = header.unpack_from(frame)
+        self.frames.append((direction, op, length, time.monotonic_ns(),
+                            bytes(frame[8:]) if self.payloads else None))
+
+    def clear(self):
+        self.frames.clear()
+
+    def dump(self, path):
+        with open(path, 'wb') as file:
+            file.write(MAGIC)
+            for direction, op, length, timestamp, payload in list(self.frames):
+                payload = payload or b''
+                file.write(record_header.pack(direction, op, length, timestamp, len(payload)))
+                file.write(payload)
+
+
+def load(path):
+    # the frames of a dump as (direction, op, length, timestamp_ns, payload or None) tuples
+    with open(path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('{} is not a pypresence recording'.format(path))
+    frames = []
+    offset = len(MAGIC)
+    while offset < len(data):
+        direction, op, length, timestamp, stored = record_header.unpack_from(data, offset)
+        offset += record_header.size
+        frames.append((direction, op, length, timestamp, data[offset:offset + stored] if stored else None))
+        offset += stored
+    return frames
+
+
+async def replay(frames, client, speed=None):
+    # Feed the received frames of a recording through client's parser and dispatcher, as if they came
+    # from the pipe. speed=None replays as fast as possible, otherwise 1.0 is real time, 2.0 twice as fast.
+    if client.loop is None:
+        client.loop = asyncio.get_running_loop()
+    client.connected = True
+    received = [frame for frame in frames if frame[0] == RECEIVED and frame[4] is not None]
+    start = time.monotonic_ns()
+    first = received[0][3] if received else 0
+    for direction, op, length, timestamp, payload in received:
+        if speed:
+            delay = (timestamp - first) / speed - (time.monotonic_ns() - start)
+            if delay > 0:
+                await asyncio.sleep(delay / 1e9)
+        client._on_frame(op, payload)
+    return len(received)
+
+
+async def serve(frames, ipc_dir, pipe=0, speed=1.0):
+    # A local socket that plays the received frames back to whoever connects, starting after their handshake.
+    # Nonces are a per-connection counter, so a client repeating the recorded session gets matching replies.
+    path = os.path.join(ipc_dir, 'discord-ipc-' + str(pipe))
+    received = [frame for frame in frames if frame[0] == RECEIVED and frame[4] is not None]
+
+    async def play(reader, writer):
+        await reader.readexactly(header.size)
+        first = received[0][3] if received else 0
+        start = time.monotonic_ns()
+        for direction, op, length, timestamp, payload in received:
+            if speed:
+                delay = (timestamp - first) / speed - (time.monotonic_ns() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay / 1e9)
+            writer.write(header.pack(op, len(payload)) + payload)
+            await writer.drain()
+        # stay connected until the client hangs up
+        while await reader.read(65536):
+            pass
+        writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(play, path)
+    async with server:
+        await server.serve_forever()
+
+
+def summary(frames):
+    lines = []
+    if not frames:
+        return 'empty recording'
+    duration = (frames[-1][3] - frames[0][3]) / 1e9
+    counts = collections.Counter((direction, op) for direction, op, *_ in frames)
+    sizes = collections.Counter()
+    for direction, op, length, *_ in frames:
+        sizes[direction, op] += length
+    lines.append('{} frames over {:.3f}s, payloads {}'.format(
+        len(frames), duration, 'stored' if any(frame[4] is not None for frame in frames) else 'not stored'))
+    for (direction, op), count in sorted(counts.items()):
+        lines.append('  {:<8} op {}  {:>8} frames  {:>10} bytes'.format(
+            'sent' if direction == SENT else 'received', op, count, sizes[direction, op]))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pypresence.recorder')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info_parser = commands.add_parser('info', help='summarize a recording')
+    info_parser.add_argument('file')
+    replay_parser = commands.add_parser('replay', help='run the received frames through a client\'s parser and dispatcher')
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--speed', type=float, default=None, help='1.0 for real time, as fast as possible if left out')
+    replay_parser.add_argument('--profile', action='store_true', help='run under cProfile and print the hottest functions')
+    serve_parser = commands.add_parser('serve', help='serve the received frames from a local Discord stand-in socket')
+    serve_parser.add_argument('file')
+    serve_parser.add_argument('--dir', required=True, help='directory to put discord-ipc-<pipe> in')
+    serve_parser.add_argument('--pipe', type=int, default=0)
+    serve_parser.add_argument('--speed', type=float, default=1.0)
+    options = parser.parse_args(argv)
+
+    frames = load(options.file)
+    if options.command == 'info':
+        print(summary(frames))
+    elif options.command == 'replay':
+        from .client import AsyncClient
+
+        client = AsyncClient('0', pipe=None)
+        events = collections.Counter()
+        client._events = _CountingHandlers(events)
+
+        def run():
+            start = time.perf_counter()
+            count = asyncio.run(replay(frames, client, options.speed))
+            elapsed = time.perf_counter() - start
+            print('replayed {} frames in {:.3f}s ({:.0f} frames/s)'.format(count, elapsed, count / elapsed if elapsed else 0))
+            for evt, count in events.most_common():
+                print('  {:<32} {}'.format(evt, count))
+
+        if options.profile:
+            import cProfile
+            import pstats
+
+            profiler = cProfile.Profile()
+            profiler.runcall(run)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        else:
+            run()
+    elif options.command == 'serve':
+        try:
+            asyncio.run(serve(frames, options.dir, options.pipe, options.speed))
+        except KeyboardInterrupt:
+            pass
+
+
+class _CountingHandlers(dict):
+    # stands in for client._events during replay: every event has a handler that just counts it
+
+    def __init__(self, counter):
+        super().__init__()
+        self.counter = counter
+
+    def get(self, evt, default=None):
+        return lambda data: self.counter.update((evt,))
+
+
+if __name__ == '__main__':
+    main()
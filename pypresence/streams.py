@@ -0,0 +1,135 @@
+import collections
+import weakref
+
+from .dispatch import OVERFLOW_POLICIES
+from .exceptions import *
+
+# what an EventStream yields: the event's name and its data, the same object every stream on the event gets
+Event = collections.namedtuple('Event', 'name data')
+
+
+class EventStream:
+    # One consumer's events, see BaseClient.events(). Every stream has its own bounded buffer: when it is full,
+    # overflow='block' stops reading from Discord until the consumer has caught up to half of maxsize,
+    # 'drop_oldest' and 'drop_newest' throw an event away. Async clients iterate with async for, sync ones with for.
+
+    def __init__(self, client, names, predicate=None, maxsize=256, overflow='block', args=None):
+        if not names:
+            raise PyPresenceException('events() needs at least one event name.')
+        if overflow not in OVERFLOW_POLICIES:
+            raise PyPresenceException('overflow must be one of {}'.format(', '.join(OVERFLOW_POLICIES)))
+        self.client = client
+        self.names = tuple(dict.fromkeys(name.upper() for name in names))
+        self.predicate = predicate
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.args = {} if args is None else args
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+
+        self._buffer = collections.deque()
+        self._waiter = None
+        self._blocked = False
+        self._ended = False
+        self._subscribed = False
+        # buffer from now on, so nothing sent between here and the subscription is missed
+        self._ref = client._add_stream(self)
+        # the client only holds the stream weakly: one that is dropped unclosed is closed for it
+        self._finalizer = weakref.finalize(self, client._stream_collected, self._ref, self.names, self.args)
+        self._finalizer.atexit = False
+
+    def _put(self, event):
+        # called on the client's loop for every event named, with the Event shared by all streams
+        if self.predicate is not None:
+            try:
+                if not self.predicate(event):
+                    return
+            except Exception as err:
+                self.client.loop.call_exception_handler({
+                    'message': 'Exception in event stream predicate',
+                    'exception': err,
+                })
+                return
+        self.received += 1
+        if len(self._buffer) >= self.maxsize:
+            if self.overflow == 'drop_newest':
+                self.dropped += 1
+                return
+            if self.overflow == 'drop_oldest':
+                self._buffer.popleft()
+                self.dropped += 1
+            elif not self._blocked:
+                self._blocked = True
+                self.client._stream_blocked(self._ref)
+        self._buffer.append(event)
+        self._wake()
+
+    def _end(self):
+        # the client closed or lost its connection for good: what's buffered can still be read
+        self._ended = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _next(self):
+        # the next Event, or None once the stream is over
+        if self.closed:
+            return None
+        if not self._subscribed:
+            self._subscribed = await self.client._subscribe_stream(self)
+        while not self._buffer:
+            if self.closed or self._ended:
+                return None
+            self._waiter = self.client.loop.create_future()
+            await self._waiter
+        event = self._buffer.popleft()
+        if self._blocked and len(self._buffer) <= self.maxsize // 2:
+            self._blocked = False
+            self.client._stream_unblocked(self._ref)
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._next()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.client._run(self._next())
+        if event is None:
+            raise StopIteration
+        return event
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._finalizer.detach()
+        self._buffer.clear()
+        self._blocked = False
+        self._wake()
+        await self.client._remove_stream(self)
+
+    def close(self):
+        return self.client._run(self.aclose())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,295 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+
+from .exceptions import *
+from .payloads import dumps, header, loads
+from .protocol import OP_CLOSE, OP_FRAME, OP_HANDSHAKE, OP_PING, OP_PONG
+
+# An in-process stand-in for the Discord client's IPC server, for tests and benchmarks.
+#
+#     server = FakeDiscordServer()
+#     server.start_in_thread()
+#     os.environ['XDG_RUNTIME_DIR'] = server.ipc_dir   # or pass the path around yourself
+#     rpc = Presence(client_id)
+#     ...
+#     server.stop()
+#
+# Or without a socket, for sync clients: Presence(client_id, transport=MemoryTransport(server)).
+
+
+class FakeDiscordServer:
+
+    def __init__(self, ipc_dir=None, pipe=0, latency=0, responses=None, event_rate=0,
+                 event_name='MESSAGE_CREATE', event_data=None, user=None):
+        # a directory made here is removed again by close()
+        self._owns_dir = not ipc_dir
+        self.ipc_dir = ipc_dir or tempfile.mkdtemp(prefix='pypresence-')
+        self.path = os.path.join(self.ipc_dir, 'discord-ipc-' + str(pipe))
+        # seconds before a command is answered
+        self.latency = latency
+        # cmd -> data sent back, the command's args are echoed for anything not in here
+        self.responses = responses or {}
+        # synthetic events per second sent to every connection subscribed to event_name
+        self.event_rate = event_rate
+        self.event_name = event_name
+        self.event_data = event_data if event_data is not None else {'content': 'hello'}
+        self.user = user or {'id': '1', 'username': 'pypresence', 'discriminator': '0001'}
+
+        self.frames_received = 0
+        self.commands = {}
+        self.connections = []
+        self.loop = None
+        self._server = None
+        self._thread = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if self._owns_dir:
+            os.makedirs(self.ipc_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await self.loop.create_unix_server(lambda: _FakeConnection(self), self.path)
+        return self
+
+    async def close(self):
+        for connection in list(self.connections):
+            connection.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self._owns_dir:
+            shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start_in_thread(self):
+        # for sync clients: the server gets its own loop on a daemon thread
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-discord', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+        self.loop.close()
+
+    def stall(self, stalled=True):
+        # stop reading from every connection, like a hung Discord, or start again with stalled=False
+        def apply():
+            for connection in self.connections:
+                if connection.transport is not None and not connection.transport.is_closing():
+                    if stalled:
+                        connection.transport.pause_reading()
+                    else:
+                        connection.transport.resume_reading()
+
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self.loop.call_soon_threadsafe(apply)
+        else:
+            apply()
+
+    def burst(self, count, evt=None, data=None):
+        # send count events right now to everyone subscribed to evt, safe to call from any thread
+        def send():
+            for connection in self.connections:
+                connection.send_events(evt or self.event_name, data if data is not None else self.event_data, count)
+
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self.loop.call_soon_threadsafe(send)
+        else:
+            send()
+
+
+class _FakeConnection(asyncio.Protocol):
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.subscriptions = set()
+        self._event_task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.append(self)
+        if self.server.event_rate and self.server.loop is not None:
+            self._event_task = self.server.loop.create_task(self._emit_events())
+
+    def connection_lost(self, exc):
+        self.server.connections.remove(self)
+        if self._event_task is not None:
+            self._event_task.cancel()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def data_received(self, data):
+        self.buffer += data
+        offset = 0
+        while len(self.buffer) - offset >= 8:
+            op, length = header.unpack_from(self.buffer, offset)
+            if len(self.buffer) - offset - 8 < length:
+                break
+            payload = bytes(self.buffer[offset + 8:offset + 8 + length])
+            offset += 8 + length
+            self.server.frames_received += 1
+            self.frame_received(op, payload)
+        del self.buffer[:offset]
+
+    def frame_received(self, op, payload):
+        if op == OP_PING:
+            self.send(OP_PONG, payload)
+            return
+        if op == OP_CLOSE:
+            self.transport.close()
+            return
+        message = loads(payload)
+        if op == OP_HANDSHAKE:
+            self.send_json(OP_FRAME, {
+                'cmd': 'DISPATCH',
+                'data': {'v': 1, 'config': {}, 'user': self.server.user},
+                'evt': 'READY',
+                'nonce': None,
+            })
+            return
+
+        cmd = message.get('cmd')
+        self.server.commands[cmd] = self.server.commands.get(cmd, 0) + 1
+        if cmd == 'SUBSCRIBE':
+            self.subscriptions.add(message.get('evt'))
+        elif cmd == 'UNSUBSCRIBE':
+            self.subscriptions.discard(message.get('evt'))
+        reply = {
+            'cmd': cmd,
+            'evt': message.get('evt'),
+            'nonce': message.get('nonce'),
+            'data': self.server.responses.get(cmd, message.get('args')),
+        }
+        if self.server.latency:
+            self.server.loop.call_later(self.server.latency, self.send_json, OP_FRAME, reply)
+        else:
+            self.send_json(OP_FRAME, reply)
+
+    def send(self, op, payload):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(header.pack(op, len(payload)) + payload)
+
+    def send_json(self, op, message):
+        self.send(op, dumps(message))
+
+    def send_events(self, evt, data, count):
+        if evt not in self.subscriptions:
+            return
+        # same key order as Discord
+        payload = dumps({'cmd': 'DISPATCH', 'data': data, 'evt': evt, 'nonce': None})
+        self.send_frames(OP_FRAME, payload, count)
+
+    def send_frames(self, op, payload, count):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write((header.pack(op, len(payload)) + payload) * count)
+
+    async def _emit_events(self):
+        # batched per 10ms tick so high rates don't need a timer per event
+        tick = 0.01
+        owed = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            owed += self.server.event_rate * tick
+            count = int(owed)
+            if count:
+                owed -= count
+                self.send_events(self.server.event_name, self.server.event_data, count)
+
+
+class MemoryTransport:
+    # A blocking transport (see transport.py) that hands frames to a FakeDiscordServer's connection logic
+    # directly, in the calling thread: no socket, no loop. The server needn't be started and its latency isn't
+    # used. A server with an event_rate is refused, burst() works instead.
+
+    def __init__(self, server=None):
+        if server is not None and server.event_rate:
+            raise PyPresenceException('MemoryTransport has no loop to send event_rate events from, use burst().')
+        self.server = server if server is not None else FakeDiscordServer(ipc_dir=tempfile.gettempdir())
+        self._connection = None
+        self._inbound = bytearray()
+
+    def open(self, path):
+        self.close()
+        self._inbound.clear()
+        self._connection = _FakeConnection(self.server)
+        self._connection.connection_made(_MemoryEnd(self))
+
+    def write(self, data):
+        if self._connection is None:
+            raise InvalidPipe
+        self._connection.data_received(data)
+
+    def writelines(self, frames):
+        self.write(b''.join(frames))
+
+    def read_frame(self, idle=False):
+        # nothing else can send in the meantime, so waiting would be forever
+        if len(self._inbound) < 8:
+            raise InvalidPipe if self._connection is None else ConnectionTimeout
+        op, length = header.unpack_from(self._inbound)
+        payload = bytes(self._inbound[8:8 + length])
+        del self._inbound[:8 + length]
+        return op, payload
+
+    def readable(self):
+        return len(self._inbound) >= 8
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.connection_lost(None)
+
+    def is_closing(self):
+        return self._connection is None
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+class _MemoryEnd:
+    # the server's side of a MemoryTransport
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def write(self, data):
+        self.transport._inbound += data
+
+    def is_closing(self):
+        return self.transport._connection is None
+
+    def close(self):
+        self.transport.close()
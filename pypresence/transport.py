@@ -0,0 +1,123 @@
+import select
+import socket
+import sys
+
+from .exceptions import *
+from .payloads import header
+
+# Blocking transports, for sync clients that only make calls:
+#
+#     rpc = Presence(client_id, transport=SocketTransport(timeout=5))
+#
+# The client then has no event loop at all. Requests are written straight to the pipe and the client reads
+# frames until their reply is there, handling any events that come before it. Without a transport clients
+# use asyncio, which everything that runs in the background (threaded, reconnect, coalesce, heartbeat,
+# rotate, event streams) needs. A transport has the write side of an asyncio transport, so the client can
+# write to either the same way, and read_frame() for the read side. See testing.MemoryTransport for one
+# without a socket.
+
+
+class SocketTransport:
+    # A plain socket (a file on Windows) with the same framing as IPCProtocol. Every read and write that
+    # takes more than timeout seconds raises ConnectionTimeout and closes the connection.
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self._socket = None
+        self._pipe = None
+        self._buffer = bytearray()
+
+    def open(self, path):
+        self._buffer.clear()
+        if sys.platform == 'win32':
+            # no timeouts on a named pipe opened as a file
+            try:
+                self._pipe = open(path, 'r+b', buffering=0)
+            except OSError:
+                raise InvalidPipe
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(path)
+        except (OSError, socket.timeout):
+            sock.close()
+            raise InvalidPipe
+        self._socket = sock
+
+    def write(self, data):
+        try:
+            if self._socket is not None:
+                self._socket.sendall(data)
+            elif self._pipe is not None:
+                self._pipe.write(data)
+            else:
+                raise InvalidPipe
+        except socket.timeout:
+            self.close()
+            raise ConnectionTimeout
+        except OSError:
+            self.close()
+            raise InvalidPipe
+
+    def writelines(self, frames):
+        self.write(b''.join(frames))
+
+    def read_frame(self, idle=False):
+        # the next (op, payload) from Discord. idle waits for it as long as it takes, e.g. between events
+        if idle and self._socket is not None and not self._buffer:
+            select.select([self._socket], [], [])
+        op, length = header.unpack(self._read(8))
+        return op, self._read(length)
+
+    def readable(self):
+        # whether a read would find something without waiting
+        if self._buffer:
+            return True
+        if self._socket is None:
+            return False
+        return bool(select.select([self._socket], [], [], 0)[0])
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            try:
+                if self._socket is not None:
+                    data = self._socket.recv(65536)
+                elif self._pipe is not None:
+                    data = self._pipe.read(size - len(self._buffer))
+                else:
+                    raise InvalidPipe
+            except socket.timeout:
+                self.close()
+                raise ConnectionTimeout
+            except OSError:
+                self.close()
+                raise InvalidPipe
+            if not data:
+                self.close()
+                raise InvalidPipe
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._pipe is not None:
+            self._pipe.close()
+            self._pipe = None
+
+    def is_closing(self):
+        return self._socket is None and self._pipe is None
+
+    def get_write_buffer_size(self):
+        # sendall() returns once everything is written
+        return 0
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
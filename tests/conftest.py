@@ -0,0 +1,45 @@
+import asyncio
+import contextlib
+import inspect
+
+import pytest
+
+from pypresence.testing import FakeDiscordServer
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # async tests run on a fresh loop of their own, no plugin needed
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**args))
+        return True
+
+
+@pytest.fixture
+def discord(monkeypatch):
+    # async with discord(**options) as server: a FakeDiscordServer on the running loop that new clients connect to
+    @contextlib.asynccontextmanager
+    async def serve(**options):
+        async with FakeDiscordServer(**options) as server:
+            monkeypatch.setenv('XDG_RUNTIME_DIR', server.ipc_dir)
+            yield server
+    return serve
+
+
+@pytest.fixture
+def discord_thread(monkeypatch):
+    # a FakeDiscordServer on its own thread, for sync clients
+    server = FakeDiscordServer().start_in_thread()
+    monkeypatch.setenv('XDG_RUNTIME_DIR', server.ipc_dir)
+    yield server
+    server.stop()
+
+
+async def until(condition, timeout=2):
+    # wait for something the loop does in the background
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError('timed out waiting')
+        await asyncio.sleep(0.005)
@@ -0,0 +1,68 @@
+import asyncio
+
+from pypresence import AsyncClient
+from pypresence.payloads import dumps, header
+from pypresence.protocol import OP_FRAME
+
+from conftest import until
+
+
+async def test_replies_are_routed_by_nonce(discord):
+    async with discord(latency=0.2) as server:
+        client = AsyncClient(1)
+        await client.start()
+        slow = asyncio.ensure_future(client.get_guild(1))
+        await until(lambda: server.commands.get('GET_GUILD'))
+        # answered before the first one
+        server.latency = 0
+        fast = await client.get_guild(2)
+        assert not slow.done()
+        assert fast['data'] == {'guild_id': '2'}
+        assert (await slow)['data'] == {'guild_id': '1'}
+        await client.close()
+
+
+async def test_concurrent_requests_get_their_own_replies(discord):
+    async with discord(latency=0.01) as server:
+        client = AsyncClient(1, dedupe=False)
+        await client.start()
+        replies = await asyncio.gather(*(client.get_channel(i) for i in range(50)))
+        assert [reply['data']['channel_id'] for reply in replies] == [str(i) for i in range(50)]
+        assert server.commands['GET_CHANNEL'] == 50
+        assert not client._pending
+        await client.close()
+
+
+async def test_events_interleaved_with_replies(discord):
+    async with discord(latency=0.05) as server:
+        client = AsyncClient(1)
+        await client.start()
+        received = []
+        await client.register_event('MESSAGE_CREATE', received.append)
+        reply = asyncio.ensure_future(client.get_guild(7))
+        await until(lambda: server.commands.get('GET_GUILD'))
+        # these arrive while the reply is outstanding and must not be taken for it
+        server.burst(100, data={'content': 'hi'})
+        assert (await reply)['data'] == {'guild_id': '7'}
+        await until(lambda: len(received) == 100)
+        assert received[0] == {'content': 'hi'}
+        await client.close()
+
+
+async def test_event_split_across_reads(discord):
+    async with discord() as server:
+        client = AsyncClient(1)
+        await client.start()
+        received = []
+        await client.register_event('MESSAGE_CREATE', received.append)
+        payload = dumps({'cmd': 'DISPATCH', 'data': {'n': 1}, 'evt': 'MESSAGE_CREATE', 'nonce': None})
+        data = (header.pack(OP_FRAME, len(payload)) + payload) * 3
+        # a byte at a time, so every frame is split across reads
+        transport = server.connections[0].transport
+        for i in range(len(data)):
+            transport.write(data[i:i + 1])
+            await asyncio.sleep(0)
+        await until(lambda: len(received) == 3)
+        assert (await client.get_guild(1))['data'] == {'guild_id': '1'}
+        await client.close()
+
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from pypresence import AsyncPresence, WriteBufferFull
+
+from conftest import until
+
+
+async def test_coalesce_sends_only_the_latest(discord):
+    async with discord() as server:
+        rpc = AsyncPresence(1, coalesce=True, coalesce_window=0.1)
+        await rpc.connect()
+        for i in range(20):
+            assert await rpc.update(state=str(i)) is None
+        await until(lambda: server.commands.get('SET_ACTIVITY') == 2 and rpc._in_flight_key is None)
+        await asyncio.sleep(0.2)
+        # the first went out at once, the rest were replaced by the last
+        assert server.commands['SET_ACTIVITY'] == 2
+        assert rpc._last_activity.state == '19'
+        await rpc.close()
+
+
+async def test_coalesce_skips_the_activity_discord_has(discord):
+    async with discord() as server:
+        rpc = AsyncPresence(1, coalesce=True, coalesce_window=0.05)
+        await rpc.connect()
+        await rpc.update(state='A')
+        await until(lambda: rpc._acked_key is not None)
+        await asyncio.sleep(0.1)
+        await rpc.update(state='A')
+        await asyncio.sleep(0.1)
+        assert server.commands['SET_ACTIVITY'] == 1
+        await rpc.close()
+
+
+async def test_coalesce_resends_an_acked_activity_behind_a_newer_one(discord):
+    async with discord(latency=0.2) as server:
+        rpc = AsyncPresence(1, coalesce=True, coalesce_window=0.1)
+        await rpc.connect()
+        await rpc.update(state='A')
+        await until(lambda: rpc._acked_key is not None)
+        await asyncio.sleep(0.1)
+        await rpc.update(state='B')
+        await until(lambda: rpc._in_flight_key is not None)
+        # A was acked, but B is about to replace it
+        await rpc.update(state='A')
+        await until(lambda: server.commands['SET_ACTIVITY'] == 3 and rpc._in_flight_key is None)
+        assert rpc._last_activity.state == 'A'
+        await rpc.close()
+
+
+async def test_updates_while_connecting_return_at_once(discord):
+    async with discord(latency=0.1) as server:
+        rpc = AsyncPresence(1)
+        connecting = rpc.connect(block=False)
+        assert await rpc.update(state='1') is None
+        assert await rpc.update(state='2') is None
+        await connecting
+        await until(lambda: rpc._last_activity is not None)
+        assert server.commands == {'SET_ACTIVITY': 1}
+        assert rpc._last_activity.state == '2'
+        await rpc.close()
+
+
+async def test_drop_stale_sends_and_counts_only_the_newest(discord):
+    async with discord() as server:
+        rpc = AsyncPresence(1, write_buffer_limit=16 * 1024, write_overflow='drop_stale')
+        await rpc.connect()
+        server.stall()
+        await asyncio.sleep(0.01)
+        updates = [asyncio.ensure_future(rpc.update(state='x' * 200 + str(i))) for i in range(2000)]
+        await until(lambda: rpc._write_paused)
+        await asyncio.sleep(0.05)
+        server.stall(False)
+        replies = await asyncio.gather(*updates)
+        dropped = sum(reply is None for reply in replies)
+        assert dropped
+        assert replies[-1]['data']['activity']['state'].endswith('1999')
+        assert server.commands['SET_ACTIVITY'] == 2000 - dropped
+        assert rpc.stats()['commands']['SET_ACTIVITY']['count'] == 2000 - dropped
+        assert rpc._last_activity.state.endswith('1999')
+        await rpc.close()
+
+
+async def test_raise_fails_fast_while_discord_is_not_reading(discord):
+    async with discord() as server:
+        rpc = AsyncPresence(1, write_buffer_limit=16 * 1024, write_overflow='raise')
+        await rpc.connect()
+        server.stall()
+        await asyncio.sleep(0.01)
+        updates = [asyncio.ensure_future(rpc.update(state='x' * 200 + str(i))) for i in range(2000)]
+        await until(lambda: rpc._write_paused)
+        await asyncio.sleep(0.05)
+        failed = [update for update in updates if update.done() and isinstance(update.exception(), WriteBufferFull)]
+        assert failed
+        server.stall(False)
+        await asyncio.gather(*updates, return_exceptions=True)
+        with pytest.raises(WriteBufferFull):
+            await failed[0]
+        # Discord reading again makes room for new requests
+        assert (await rpc.update(state='after'))['data']['activity']['state'] == 'after'
+        await rpc.close()
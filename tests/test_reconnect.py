@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from pypresence import AsyncClient, AsyncPresence, InvalidPipe
+
+from conftest import until
+
+
+async def test_reconnect_replays_subscriptions_and_activity(discord):
+    async with discord() as server:
+        recovered = []
+        client = AsyncClient(1, reconnect=True, reconnect_delay=0.01, on_reconnect=recovered.append)
+        await client.start()
+        received = []
+        await client.register_event('MESSAGE_CREATE', received.append)
+        await client.set_activity(state='playing')
+        server.connections[0].close()
+        await until(lambda: recovered)
+        assert client.connected
+        assert client.reconnects == 1
+        assert server.commands == {'SUBSCRIBE': 2, 'SET_ACTIVITY': 2}
+        # the new connection is subscribed again
+        server.burst(3)
+        await until(lambda: len(received) == 3)
+        await client.close()
+
+
+async def test_reconnect_replays_the_latest_activity_only(discord):
+    async with discord() as server:
+        rpc = AsyncPresence(1, reconnect=True, reconnect_delay=0.01)
+        await rpc.connect()
+        await rpc.update(state='old')
+        await rpc.update(state='new')
+        await rpc.clear()
+        await rpc.update(state='newest')
+        server.commands.clear()
+        server.connections[0].close()
+        await until(lambda: rpc.reconnects)
+        assert server.commands == {'SET_ACTIVITY': 1}
+        assert server.connections and rpc._last_activity.state == 'newest'
+        await rpc.close()
+
+
+async def test_requests_in_flight_fail_when_the_connection_drops(discord):
+    async with discord(latency=1) as server:
+        client = AsyncClient(1)
+        await client.start()
+        reply = asyncio.ensure_future(client.get_guild(1))
+        await until(lambda: server.commands.get('GET_GUILD'))
+        server.connections[0].close()
+        with pytest.raises(InvalidPipe):
+            await reply
+        assert not client._pending
+        await client.close()
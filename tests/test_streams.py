@@ -0,0 +1,93 @@
+import asyncio
+import gc
+
+from pypresence import AsyncClient, Client
+
+from conftest import until
+
+
+async def test_stream_reads_events(discord):
+    async with discord() as server:
+        client = AsyncClient(1)
+        await client.start()
+        names = []
+        async with client.events('MESSAGE_CREATE') as stream:
+            # subscribes on the first read
+            reader = asyncio.ensure_future(stream.__anext__())
+            await until(lambda: server.commands.get('SUBSCRIBE'))
+            server.burst(4)
+            names.append((await reader).name)
+            async for event in stream:
+                names.append(event.name)
+                if len(names) == 3:
+                    break
+        assert names == ['MESSAGE_CREATE'] * 3
+        await until(lambda: server.commands.get('UNSUBSCRIBE'))
+        assert server.commands == {'SUBSCRIBE': 1, 'UNSUBSCRIBE': 1}
+        await client.close()
+
+
+async def test_stream_left_with_break_is_closed(discord):
+    async with discord() as server:
+        client = AsyncClient(1)
+        await client.start()
+
+        async def first():
+            async for event in client.events('MESSAGE_CREATE', maxsize=4):
+                return event
+
+        reader = asyncio.ensure_future(first())
+        await until(lambda: server.commands.get('SUBSCRIBE'))
+        # more than the stream holds, so it pauses reading until it is gone
+        server.burst(50)
+        assert (await reader).name == 'MESSAGE_CREATE'
+        gc.collect()
+        await until(lambda: server.commands.get('UNSUBSCRIBE'))
+        assert not client._streams
+        assert client._read_pauses == 0
+        # and replies get through again
+        assert (await asyncio.wait_for(client.get_guild(1), 1))['data'] == {'guild_id': '1'}
+        await client.close()
+
+
+async def test_stream_keeps_handlers_subscription(discord):
+    async with discord() as server:
+        client = AsyncClient(1)
+        await client.start()
+        handled = []
+        await client.register_event('MESSAGE_CREATE', handled.append)
+        async with client.events('MESSAGE_CREATE') as stream:
+            # already subscribed by the handler
+            server.burst(1)
+            assert (await asyncio.wait_for(stream.__anext__(), 1)).name == 'MESSAGE_CREATE'
+        # the handler still wants the event
+        assert 'UNSUBSCRIBE' not in server.commands
+        server.burst(1)
+        await until(lambda: len(handled) == 2)
+        await client.close()
+
+
+async def test_streams_end_when_the_client_closes(discord):
+    async with discord():
+        client = AsyncClient(1)
+        await client.start()
+        stream = client.events('MESSAGE_CREATE')
+        reader = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        await client.close()
+        try:
+            await reader
+        except StopAsyncIteration:
+            pass
+        else:
+            raise AssertionError('the stream did not end')
+
+
+def test_sync_stream(discord_thread):
+    client = Client(1, threaded=True)
+    client.start()
+    with client.events('MESSAGE_CREATE') as stream:
+        client.subscribe('MESSAGE_CREATE')
+        discord_thread.burst(2)
+        assert [event.name for _, event in zip(range(2), stream)] == ['MESSAGE_CREATE'] * 2
+    client.close()
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from pypresence import Client, ConnectionTimeout, InvalidPipe, Presence, PyPresenceException
+from pypresence.testing import FakeDiscordServer, MemoryTransport
+from pypresence.transport import SocketTransport
+
+
+def test_memory_transport_round_trip():
+    server = FakeDiscordServer(responses={'GET_GUILD': {'id': '5', 'name': 'guild'}})
+    client = Client(1, transport=MemoryTransport(server))
+    client.start()
+    assert client.loop is None
+    assert client.get_guild(5)['data'] == {'id': '5', 'name': 'guild'}
+    assert client.set_activity(state='here')['data']['activity']['state'] == 'here'
+    assert server.commands == {'GET_GUILD': 1, 'SET_ACTIVITY': 1}
+    client.close()
+    assert not server.connections
+
+
+def test_memory_transport_handles_events_before_the_reply():
+    server = FakeDiscordServer()
+    client = Client(1, transport=MemoryTransport(server))
+    client.start()
+    received = []
+    client.register_event('MESSAGE_CREATE', received.append)
+    server.burst(3)
+    assert client.get_guild(1)['data'] == {'guild_id': '1'}
+    assert received == [{'content': 'hello'}] * 3
+    client.close()
+
+
+def test_memory_transport_refuses_event_rate():
+    with pytest.raises(PyPresenceException):
+        MemoryTransport(FakeDiscordServer(event_rate=100))
+
+
+def test_memory_transport_times_out_without_a_reply():
+    server = FakeDiscordServer()
+    client = Client(1, transport=MemoryTransport(server))
+    client.start()
+    server.connections[0].frame_received = lambda op, payload: None
+    with pytest.raises(ConnectionTimeout):
+        client.get_guild(1)
+    assert not client.connected
+    client.close()
+
+
+def test_socket_transport(discord_thread):
+    rpc = Presence(1, transport=SocketTransport(timeout=1))
+    rpc.connect()
+    assert rpc.update(state='socket')['data']['activity']['state'] == 'socket'
+    assert rpc.clear()['data']['activity'] is None
+    assert discord_thread.commands == {'SET_ACTIVITY': 2}
+    rpc.close()
+
+
+def test_socket_transport_losing_discord(discord_thread):
+    rpc = Presence(1, transport=SocketTransport(timeout=1))
+    rpc.connect()
+    asyncio.run_coroutine_threadsafe(discord_thread.close(), discord_thread.loop).result()
+    with pytest.raises(InvalidPipe):
+        rpc.update(state='gone')
+    assert not rpc.connected
+    rpc.close()
+
+
+def test_blocking_transport_refuses_background_features():
+    with pytest.raises(PyPresenceException):
+        Presence(1, transport=MemoryTransport(), threaded=True)
+    with pytest.raises(PyPresenceException):
+        Presence(1, transport=MemoryTransport(), coalesce=True)
+    with pytest.raises(PyPresenceException):
+        Client(1, transport=MemoryTransport()).events('MESSAGE_CREATE')